@@ -0,0 +1,51 @@
+# Benchmark del arranque: cuánto tarda "import report" (lo que se espera antes de que se abra la
+# ventana) según -X importtime, y qué dependencias pesadas se cargan ya al importarlo.
+# pandas, folium, PIL y selenium solo deben cargarse al generar el informe, no al abrir la ventana.
+# Sale con código 1 si se supera el límite o si se cuela alguna dependencia pesada, para poder
+# usarlo como comprobación antes de publicar una versión.
+#
+# Uso: python benchmarks/bench_arranque.py [--repeticiones 5] [--limite-ms 300]
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PESADAS = ["pandas", "numpy", "folium", "branca", "jinja2", "requests", "selenium", "PIL"]
+
+def medir_importacion():
+    # Devuelve (milisegundos de "import report", dependencias pesadas ya cargadas)
+    codigo = f"import sys, report; print(','.join(m for m in {PESADAS!r} if m in sys.modules))"
+    proceso = subprocess.run([sys.executable, "-X", "importtime", "-c", codigo], cwd=RAIZ,
+                             capture_output=True, text=True, check=True)
+    # Formato de cada línea: "import time: <propio> | <acumulado> | <módulo>", en microsegundos
+    acumulado = next(int(coincidencia.group(1)) for coincidencia in
+                     (re.match(r"import time:\s+\d+ \|\s+(\d+) \| report$", linea) for linea in proceso.stderr.splitlines())
+                     if coincidencia)
+    cargadas = [modulo for modulo in proceso.stdout.strip().split(",") if modulo]
+    return acumulado / 1000, cargadas
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de importación de report.py")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--limite-ms", type=float, default=300)
+    args = parser.parse_args()
+
+    tiempos = []
+    cargadas = []
+    for _ in range(args.repeticiones):
+        milisegundos, cargadas = medir_importacion()
+        tiempos.append(milisegundos)
+    mediana = statistics.median(tiempos)
+    print(f"import report: mediana {mediana:.0f} ms (mín. {min(tiempos):.0f}, máx. {max(tiempos):.0f})")
+    if cargadas:
+        print(f"Dependencias pesadas cargadas al importar: {', '.join(cargadas)}")
+    if mediana > args.limite_ms or cargadas:
+        print(f"FALLO: el arranque debe quedar por debajo de {args.limite_ms:.0f} ms sin dependencias pesadas")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
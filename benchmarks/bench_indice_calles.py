@@ -0,0 +1,47 @@
+# Benchmark del índice de calles: mide cuánto cuesta asignar el barrio a N incidencias
+# con un registro de calles fijo. El tiempo por incidencia debe mantenerse constante
+# (coste lineal en el número de incidencias).
+#
+# Uso: python benchmarks/bench_indice_calles.py [num_calles]
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report import IndiceCalles
+
+PREFIJOS = ["Carrer de", "Carrer del", "Avinguda de", "Passeig de", "Plaça de", "Rambla de"]
+SILABAS = ["ma", "ri", "na", "pe", "re", "llu", "to", "sa", "gra", "cia", "ver", "dag", "ue", "bo"]
+
+def nombre_aleatorio(rng):
+    return " ".join("".join(rng.choice(SILABAS) for _ in range(rng.randint(2, 4))).capitalize()
+                    for _ in range(rng.randint(1, 3)))
+
+def main():
+    num_calles = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rng = random.Random(0)
+    nombres = [nombre_aleatorio(rng) for _ in range(num_calles)]
+    barris = [f"Barri {i % 73}" for i in range(num_calles)]
+
+    inicio = time.perf_counter()
+    indice = IndiceCalles(nombres, barris)
+    print(f"Índice de {num_calles} calles construido en {time.perf_counter() - inicio:.3f} s")
+
+    for num_incidencias in (1000, 10000, 100000):
+        direcciones = pd.Series([
+            f"{rng.choice(PREFIJOS)} {rng.choice(nombres)}" if rng.random() < 0.9 else nombre_aleatorio(rng)
+            for _ in range(num_incidencias)
+        ])
+        # Un índice nuevo por tamaño para no aprovechar direcciones ya resueltas en la ronda anterior
+        indice = IndiceCalles(nombres, barris)
+        inicio = time.perf_counter()
+        indice.asignar_barris(direcciones)
+        transcurrido = time.perf_counter() - inicio
+        print(f"{num_incidencias:>7} incidencias: {transcurrido:.3f} s "
+              f"({transcurrido / num_incidencias * 1e6:.2f} µs/incidencia)")
+
+if __name__ == "__main__":
+    main()
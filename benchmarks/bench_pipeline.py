@@ -0,0 +1,172 @@
+# Benchmark del proceso completo de generar_informes con datos sintéticos, sin datos reales de
+# auditorías ni navegador: genera un Excel de auditoría y uno de calles con las mismas columnas
+# que espera leer_datos_desde_excel, fotos y mapas de barrios, y renderiza los mapas de
+# geolocalización con un PNG dibujado al momento (pasado como renderizador_mapas).
+#
+# Para cada tamaño se hace una ejecución en frío (cachés vacías) y otra en caliente (con las
+# cachés que ha dejado la primera), cada una en su propio proceso para que la memoria máxima de
+# una no se mezcle con la de otra. Los tiempos por etapa salen de report.Metricas y se guardan
+# en un JSON para comparar versiones.
+#
+# Uso: python benchmarks/bench_pipeline.py [--tamanos 10 100 1000 10000] [--procesos 1] [--salida resultados.json]
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from PIL import Image, ImageDraw
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+import report
+
+PREFIJOS = ["Carrer de", "Carrer del", "Avinguda de", "Passeig de", "Plaça de", "Rambla de"]
+SILABAS = ["ma", "ri", "na", "pe", "re", "llu", "to", "sa", "gra", "cia", "ver", "dag", "ue", "bo"]
+DESPERFECTOS = ["Trencat", "Desgastat", "Solt", "Oxidat", "Pintada"]
+UNITATS = ["m2", "ml", "u"]
+OPERACIONS = ["Reparar", "Substituir", "Netejar"]
+INTERFERENCIES = ["Cap", "Vianants", "Trànsit"]
+
+def nombre_aleatorio(rng):
+    return " ".join("".join(rng.choice(SILABAS) for _ in range(rng.randint(2, 4))).capitalize()
+                    for _ in range(rng.randint(1, 2)))
+
+def generar_datos(carpeta, num_incidencias, num_calles=300, num_barris=25, num_fotos=20, seed=0):
+    # Crea en 'carpeta' auditoria.xlsx, calles.xlsx, fotos/ y mapas_barrios/
+    rng = random.Random(seed)
+    barris = [f"Barri {nombre_aleatorio(rng)}" for _ in range(num_barris)]
+    calles = [nombre_aleatorio(rng) for _ in range(num_calles)]
+    pd.DataFrame({"NOM_VIA": calles, "BARRI": [rng.choice(barris) for _ in calles]}).to_excel(
+        os.path.join(carpeta, "calles.xlsx"), index=False)
+
+    # Fotos de 3000x2000 con ruido, del tamaño típico de las de un móvil
+    os.makedirs(os.path.join(carpeta, "fotos"))
+    fotos = [f"foto-{i:03d}" for i in range(num_fotos)]
+    for foto in fotos:
+        canales = [Image.effect_noise((3000, 2000), rng.randint(20, 80)) for _ in range(3)]
+        Image.merge("RGB", canales).save(os.path.join(carpeta, "fotos", f"{foto}.jpg"), quality=90)
+
+    os.makedirs(os.path.join(carpeta, "mapas_barrios"))
+    for barri in barris:
+        Image.new("RGB", (1200, 900), (rng.randrange(256), 180, 200)).save(
+            os.path.join(carpeta, "mapas_barrios", f"mapa_{barri}.jpg"))
+
+    filas = []
+    for numero in range(1, num_incidencias + 1):
+        n = rng.randint(1, 3)
+        fila = {
+            "_title": ", ".join(rng.sample(["Reixes", "Peces de paviment", "Mobiliari urbà", "Fanals"], n)),
+            "lloc": f"{rng.randint(1, 300)} {rng.choice(PREFIJOS)} {rng.choice(calles)}",
+            "lloc_thoroughfare": f"{rng.choice(PREFIJOS)} {rng.choice(calles)}" if rng.random() < 0.95 else None,
+            "data": f"2023-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "imatges": ",".join(rng.sample(fotos, 2)),
+            "_latitude": 41.38 + rng.random() / 50,
+            "_longitude": 2.17 + rng.random() / 30,
+            "edifici": rng.choice([None, "Escola", "Biblioteca"]),
+            "sala": rng.choice(["A", "B", None]),
+            "numero_de_planta": rng.randint(0, 4),
+            "num_incidencia": numero,
+        }
+        for i in range(1, 4):
+            hay = i <= n
+            fila[f"{i}_tipus_de_desperfecte"] = rng.choice(DESPERFECTOS) if hay else None
+            fila[f"{i}_amidament"] = rng.randint(1, 50) if hay else None
+            fila[f"{i}_unitats"] = rng.choice(UNITATS) if hay else None
+            fila[f"{i}_tipus_operacio"] = rng.choice(OPERACIONS) if hay else None
+            fila[f"{i}_interferencia"] = rng.choice(INTERFERENCIES) if hay else None
+        filas.append(fila)
+    pd.DataFrame(filas).to_excel(os.path.join(carpeta, "auditoria.xlsx"), index=False)
+
+def mapa_simulado(latitud, longitud):
+    # Renderizador de mapas sin navegador: un PNG distinto por coordenada
+    imagen = Image.new("RGB", (report.ANCHO_MAPA, report.ALTO_MAPA), (230, 228, 220))
+    x = int((longitud * 1e5) % report.ANCHO_MAPA)
+    y = int((latitud * 1e5) % report.ALTO_MAPA)
+    ImageDraw.Draw(imagen).ellipse((x - 8, y - 8, x + 8, y + 8), fill=(200, 30, 30))
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as temporal:
+        imagen.save(temporal, format="PNG")
+    return temporal.name
+
+def ejecutar_una(carpeta, num_incidencias, modo, procesos_documento=1):
+    # Una ejecución de generar_informes; devuelve su resumen de métricas
+    if modo == "frio":
+        generar_datos(carpeta, num_incidencias)
+    caches = os.path.join(carpeta, "caches")
+    metricas = report.Metricas()
+    ruta_salida = os.path.join(carpeta, f"informe_{modo}.docx")
+    inicio = time.perf_counter()
+    report.generar_informes(
+        os.path.join(carpeta, "auditoria.xlsx"), os.path.join(carpeta, "fotos"),
+        os.path.join(carpeta, "calles.xlsx"), os.path.join(carpeta, "mapas_barrios"),
+        renderizador_mapas=mapa_simulado, version_mapas="simulado-1",
+        carpeta_cache_mapas=os.path.join(caches, "mapas"),
+        carpeta_cache_fragmentos=os.path.join(caches, "fragmentos"),
+        carpeta_cache_excel=os.path.join(caches, "excel"),
+        carpeta_cache_fotos=os.path.join(caches, "fotos"),
+        ruta_salida=ruta_salida, metricas=metricas, procesos_documento=procesos_documento,
+    )
+    segundos = time.perf_counter() - inicio
+    resumen = metricas.resumen()
+    del resumen["incidencias"]
+    resumen.update(incidencias=num_incidencias, modo=modo, procesos_documento=procesos_documento, segundos_totales=segundos,
+                   incidencias_por_segundo=num_incidencias / segundos,
+                   tamano_docx_mb=os.path.getsize(ruta_salida) / (1024 * 1024))
+    return resumen
+
+def version_codigo():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=RAIZ,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de generar_informes con datos sintéticos")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--procesos", type=int, default=1, help="procesos para montar el documento (procesos_documento)")
+    parser.add_argument("--salida", default="resultados_bench_pipeline.json")
+    parser.add_argument("--una", nargs=3, metavar=("CARPETA", "N", "MODO"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.una:
+        # Proceso hijo: el resumen va en la última línea de la salida
+        carpeta, num_incidencias, modo = args.una
+        resumen = ejecutar_una(carpeta, int(num_incidencias), modo, args.procesos)
+        print(json.dumps(resumen, default=str))
+        return
+
+    resultados = []
+    for num_incidencias in args.tamanos:
+        carpeta = tempfile.mkdtemp(prefix=f"bench_stjust_{num_incidencias}_")
+        try:
+            for modo in ("frio", "caliente"):
+                proceso = subprocess.run([sys.executable, os.path.abspath(__file__), "--una", carpeta, str(num_incidencias), modo,
+                                          "--procesos", str(args.procesos)],
+                                         capture_output=True, text=True, check=True)
+                resumen = json.loads(proceso.stdout.strip().splitlines()[-1])
+                resultados.append(resumen)
+                print(f"{num_incidencias:>6} {modo:<8} {resumen['segundos_totales']:8.2f} s"
+                      f"  {resumen['incidencias_por_segundo']:8.1f} inc/s  {resumen['rss_pico_mb'] or 0:6.0f} MB")
+        finally:
+            shutil.rmtree(carpeta, ignore_errors=True)
+
+    with open(args.salida, "w", encoding="utf-8") as archivo:
+        json.dump({
+            "version": version_codigo(),
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "resultados": resultados,
+        }, archivo, indent=1)
+    print(f"Resultados en {args.salida}")
+
+if __name__ == "__main__":
+    main()
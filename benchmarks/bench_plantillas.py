@@ -0,0 +1,62 @@
+# Benchmark del cuerpo del documento: construye las tablas de N incidencias sintéticas
+# formateando celda a celda y clonando las plantillas, sin imágenes ni mapas.
+#
+# Uso: python benchmarks/bench_plantillas.py [num_incidencias]
+import os
+import random
+import sys
+import time
+
+from docx import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import report
+
+def incidencias_sinteticas(num_incidencias, rng):
+    filas = []
+    for numero in range(1, num_incidencias + 1):
+        n = rng.randint(1, 3)
+        filas.append(report.DatosIncidencia(
+            "Peces de paviment, Mobiliari urbà", f"{numero} Carrer de Pere IV", "Carrer de Pere IV", "2023-12-20",
+            "", 41.40 + rng.random() / 100, 2.19 + rng.random() / 100, "Poblenou",
+            rng.choice([float("nan"), "Escola"]), "A", 1,
+            ["Trencat"] * n, [10] * n, ["m2"] * n, ["Reparar"] * n, ["Cap"] * n, numero,
+        ))
+    return filas
+
+def construir_cuerpo(datos_filas, usar_plantillas):
+    # Misma secuencia de tablas y filas que crear_tablas_informes, sin insertar imágenes
+    doc = Document()
+    plantillas = report.PlantillasTablas(doc) if usar_plantillas else None
+    for datos in datos_filas:
+        tabla = plantillas.nueva_tabla_incidencia(doc) if plantillas else report.construir_tabla_incidencia(doc)
+        report.poner_texto(report.celda(tabla, 0, 0), f"INCIDÈNCIA Nº {datos.num_incidencia}")
+        report.poner_texto(report.celda(tabla, 6, 1), datos.barri)
+        report.add_building_info(tabla, datos.edifici, datos.sala, datos.numero_de_planta, plantillas)
+        for i, (desperfecto, amdt, unit, interf, prop) in enumerate(zip(datos.desperfectos, datos.amidaments, datos.unitats, datos.interferencias, datos.propuestas)):
+            report.crear_bloque_desperfecto(tabla, i, desperfecto, amdt, unit, interf, prop, plantillas)
+        report.agregar_fila_titulo_grafica(tabla, plantillas)
+        if plantillas:
+            plantillas.agregar_fila(tabla, plantillas.fila_vacia)
+        else:
+            tabla.add_row()
+        doc.add_page_break()
+        tabla2 = plantillas.nueva_tabla_coordenadas(doc) if plantillas else report.construir_tabla_coordenadas(doc)
+        report.poner_texto(report.celda(tabla2, 1, 1), str(datos.latitud))
+        report.poner_texto(report.celda(tabla2, 2, 1), str(datos.longitud))
+        doc.add_page_break()
+    return doc
+
+def main():
+    num_incidencias = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    datos_filas = incidencias_sinteticas(num_incidencias, random.Random(0))
+    tiempos = {}
+    for usar_plantillas in (False, True):
+        inicio = time.perf_counter()
+        construir_cuerpo(datos_filas, usar_plantillas)
+        tiempos[usar_plantillas] = time.perf_counter() - inicio
+        print(f"{'plantillas' if usar_plantillas else 'celda a celda':>14}: {tiempos[usar_plantillas]:.2f} s")
+    print(f"Mejora: x{tiempos[False] / tiempos[True]:.1f}")
+
+if __name__ == "__main__":
+    main()
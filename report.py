@@ -1,18 +1,306 @@
+# pandas y folium tardan casi un segundo en importarse, así que se importan dentro de las
+# funciones que los usan: la ventana se abre sin esperarlos (ver precargar_dependencias)
 from docx import Document
-import pandas as pd
 from datetime import datetime
 from docx.shared import Inches, Pt, RGBColor  
 from docx.oxml import OxmlElement, parse_xml
+from lxml import etree
 from docx.oxml.ns import qn, nsdecls
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.table import _Cell
+from docx.table import _Cell, Table
+from docx.oxml.shape import CT_Inline
+from docx.image.image import Image as DocxImage
+from docx.parts.image import ImagePart
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PackURI
 from docx.enum.table import WD_ROW_HEIGHT_RULE
 import os
 import sys
-import folium
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+try:
+    import resource
+except ImportError:  # No existe en Windows
+    resource = None
+import argparse
+import traceback
+import time
+import cProfile
+import ctypes
+import io
 import tempfile
+import json
+import glob
+import pickle
+from copy import deepcopy
+import hashlib
+import shutil
+from contextlib import ExitStack, contextmanager, nullcontext
+import math
+import sqlite3
+from functools import partial
+from collections import OrderedDict
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+from typing import NamedTuple
+import re
+import unicodedata
+
+class TrabajoCancelado(Exception):
+    # Se lanza dentro de generar_informes cuando se pide cancelar el trabajo
+    pass
+
+class ControlTrabajo:
+    # Canal entre generar_informes y quien lo ejecuta (la GUI o la línea de comandos):
+    # el trabajo informa de su avance por aquí y comprueba si se ha pedido cancelarlo.
+    # Sin al_avanzar los mensajes (etapa, hecho, total) se dejan en la cola 'mensajes'
+    # para que la GUI los recoja desde su propio hilo.
+    def __init__(self, al_avanzar=None):
+        self.mensajes = queue.Queue()
+        self._al_avanzar = al_avanzar
+        self._cancelar = threading.Event()
+
+    def cancelar(self):
+        self._cancelar.set()
+
+    @property
+    def cancelado(self):
+        return self._cancelar.is_set()
+
+    def comprobar(self):
+        if self._cancelar.is_set():
+            raise TrabajoCancelado()
+
+    def avanzar(self, etapa, hecho=None, total=None):
+        self.comprobar()
+        if self._al_avanzar is not None:
+            self._al_avanzar(etapa, hecho, total)
+        else:
+            self.mensajes.put((etapa, hecho, total))
+
+def avanzar(control, etapa, hecho=None, total=None):
+    # Informar del avance (y cancelar si se ha pedido) cuando hay un control
+    if control is not None:
+        control.avanzar(etapa, hecho, total)
+
+def memoria_pico_mb(hijos=False):
+    # Memoria residente máxima (MB) del proceso, o de sus procesos hijos ya terminados con hijos=True
+    if resource is not None:
+        uso = resource.getrusage(resource.RUSAGE_CHILDREN if hijos else resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        return uso / (1024 * 1024) if sys.platform == "darwin" else uso / 1024
+    if sys.platform == "win32" and not hijos:
+        contadores = contadores_memoria_windows()
+        if contadores is not None:
+            return contadores.PeakWorkingSetSize / (1024 * 1024)
+    return None
+
+def memoria_actual_mb():
+    # Memoria residente (MB) del proceso en este momento, o None si no se puede leer en esta plataforma
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/self/statm") as archivo:
+                return int(archivo.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        except (OSError, ValueError, IndexError):
+            return None
+    if sys.platform == "win32":
+        contadores = contadores_memoria_windows()
+        if contadores is not None:
+            return contadores.WorkingSetSize / (1024 * 1024)
+    return None
+
+def contadores_memoria_windows():
+    # PROCESS_MEMORY_COUNTERS del proceso actual (GetProcessMemoryInfo), o None si falla
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [("cb", ctypes.c_ulong), ("PageFaultCount", ctypes.c_ulong),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+    contadores = PROCESS_MEMORY_COUNTERS()
+    contadores.cb = ctypes.sizeof(contadores)
+    proceso = ctypes.windll.kernel32.GetCurrentProcess()
+    if ctypes.windll.psapi.GetProcessMemoryInfo(proceso, ctypes.byref(contadores), contadores.cb):
+        return contadores
+    return None
+
+def mayor(a, b):
+    # El mayor de dos valores que pueden ser None (None solo si lo son los dos)
+    return b if a is None else a if b is None else max(a, b)
+
+class PicoMemoria:
+    # Memoria residente máxima (MB) de varios intervalos abiertos a la vez, que pueden anidarse
+    # (etapas dentro de etapas) o solaparse (etapas en varios hilos).
+    # En Linux se usa el pico que lleva el núcleo (VmHWM de /proc/self/status), que se reinicia
+    # escribiendo 5 en /proc/self/clear_refs al abrir cada intervalo. Antes de reiniciarlo, el pico
+    # acumulado se anota en todos los intervalos abiertos, que han empezado antes que el reinicio
+    # anterior, así que cada uno acaba con su pico exacto. Como el reinicio también rebaja el
+    # ru_maxrss del proceso, el pico de todo el proceso se lleva aquí (pico_proceso).
+    # Donde no se puede, un hilo muestrea la memoria actual cada intervalo_muestreo segundos
+    # mientras haya algún intervalo abierto (un pico más corto que eso puede no verse).
+    def __init__(self, intervalo_muestreo=0.01):
+        self.intervalo_muestreo = intervalo_muestreo
+        self._condicion = threading.Condition()
+        self._abiertos = {}  # intervalo -> [memoria al abrirlo, pico]
+        self._pico_proceso = None
+        self._usar_nucleo = None  # Se decide al abrir el primer intervalo
+        self._hilo = None
+
+    @staticmethod
+    def _pico_nucleo():
+        with open("/proc/self/status") as archivo:
+            for linea in archivo:
+                if linea.startswith("VmHWM:"):
+                    return int(linea.split()[1]) / 1024
+        return None
+
+    @staticmethod
+    def _reiniciar_pico_nucleo():
+        with open("/proc/self/clear_refs", "w") as archivo:
+            archivo.write("5")
+
+    def _medir(self):
+        return self._pico_nucleo() if self._usar_nucleo else memoria_actual_mb()
+
+    def _anotar(self, memoria):
+        # Con el bloqueo tomado: memoria alcanzada mientras están abiertos todos los intervalos actuales
+        if memoria is None:
+            return
+        for medida in self._abiertos.values():
+            medida[1] = mayor(medida[1], memoria)
+        self._pico_proceso = mayor(self._pico_proceso, memoria)
+
+    def abrir(self):
+        with self._condicion:
+            if self._usar_nucleo is None:
+                try:
+                    self._reiniciar_pico_nucleo()
+                    self._usar_nucleo = self._pico_nucleo() is not None
+                except (OSError, ValueError):
+                    self._usar_nucleo = False
+            self._anotar(self._medir())
+            if self._usar_nucleo:
+                self._reiniciar_pico_nucleo()
+            elif self._hilo is None:
+                self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+                self._hilo.start()
+            intervalo = object()
+            memoria = self._medir()
+            self._abiertos[intervalo] = [memoria, memoria]
+            self._condicion.notify()
+            return intervalo
+
+    def cerrar(self, intervalo):
+        # Devuelve (memoria al abrirlo, pico) del intervalo, con None si no se puede medir.
+        # Cerrar un intervalo ya cerrado no hace nada.
+        with self._condicion:
+            self._anotar(self._medir())
+            return tuple(self._abiertos.pop(intervalo, (None, None)))
+
+    def pico_proceso(self):
+        with self._condicion:
+            if self._usar_nucleo:
+                self._anotar(self._pico_nucleo())
+            return mayor(self._pico_proceso, memoria_pico_mb())
+
+    def _muestrear(self):
+        while True:
+            with self._condicion:
+                while not self._abiertos:
+                    self._condicion.wait()
+                self._anotar(memoria_actual_mb())
+            time.sleep(self.intervalo_muestreo)
+
+# Compartido por todas las Metricas del proceso: el pico del núcleo es uno solo
+PICO_MEMORIA = PicoMemoria()
+
+class Metricas:
+    # Tiempos, número de llamadas y memoria máxima por etapa de generar_informes, más el tiempo de
+    # cada incidencia al montar el documento. Se puede usar desde varios hilos a la vez.
+    # La memoria de cada etapa y de cada incidencia es la memoria residente máxima del proceso
+    # mientras dura (rss_pico_mb, ver PicoMemoria) y lo que ha subido desde el principio
+    # (rss_incremento_mb); en las etapas, el mayor valor de todas sus llamadas. Con varios hilos a
+    # la vez el pico incluye lo que reserven los demás. El pico de todo el proceso es el del resumen.
+    def __init__(self):
+        self._bloqueo = threading.Lock()
+        self._inicio = time.perf_counter()
+        self.etapas = {}  # nombre -> {"llamadas", "segundos", "rss_pico_mb", "rss_incremento_mb"}
+        self.incidencias = []  # {"num_incidencia", "segundos", "origen", "rss_pico_mb", "rss_incremento_mb"}
+        self.contadores = {}
+
+    @staticmethod
+    def abrir_memoria():
+        # Empieza a medir el pico de memoria de una etapa o incidencia; se termina con cerrar_memoria
+        return PICO_MEMORIA.abrir()
+
+    @staticmethod
+    def cerrar_memoria(intervalo):
+        # (pico, incremento desde el principio), con None en lo que no se pueda medir
+        memoria_inicio, pico = PICO_MEMORIA.cerrar(intervalo)
+        if pico is None or memoria_inicio is None:
+            return pico, None
+        return pico, pico - memoria_inicio
+
+    def registrar(self, nombre, segundos, memoria=(None, None)):
+        pico, incremento = memoria
+        with self._bloqueo:
+            etapa = self.etapas.setdefault(nombre, {"llamadas": 0, "segundos": 0.0, "rss_pico_mb": None, "rss_incremento_mb": None})
+            etapa["llamadas"] += 1
+            etapa["segundos"] += segundos
+            etapa["rss_pico_mb"] = mayor(etapa["rss_pico_mb"], pico)
+            etapa["rss_incremento_mb"] = mayor(etapa["rss_incremento_mb"], incremento)
+
+    @contextmanager
+    def etapa(self, nombre):
+        inicio = time.perf_counter()
+        intervalo = self.abrir_memoria()
+        try:
+            yield
+        finally:
+            segundos = time.perf_counter() - inicio
+            self.registrar(nombre, segundos, self.cerrar_memoria(intervalo))
+
+    def envolver(self, nombre, funcion):
+        # Devuelve funcion con cada llamada contada en la etapa 'nombre'
+        def medida(*args, **kwargs):
+            with self.etapa(nombre):
+                return funcion(*args, **kwargs)
+        return medida
+
+    def incidencia(self, num_incidencia, segundos, origen, memoria=(None, None)):
+        pico, incremento = memoria
+        with self._bloqueo:
+            self.incidencias.append({"num_incidencia": num_incidencia, "segundos": segundos, "origen": origen,
+                                     "rss_pico_mb": pico, "rss_incremento_mb": incremento})
+
+    def contar(self, nombre, cantidad=1):
+        with self._bloqueo:
+            self.contadores[nombre] = self.contadores.get(nombre, 0) + cantidad
+
+    def resumen(self):
+        with self._bloqueo:
+            return {
+                "segundos_totales": time.perf_counter() - self._inicio,
+                "rss_pico_mb": PICO_MEMORIA.pico_proceso(),
+                "rss_pico_hijos_mb": memoria_pico_mb(hijos=True),
+                "etapas": {nombre: dict(etapa) for nombre, etapa in self.etapas.items()},
+                "contadores": dict(self.contadores),
+                "incidencias": list(self.incidencias),
+            }
+
+    def guardar(self, ruta):
+        with open(ruta, "w", encoding="utf-8") as archivo:
+            json.dump(self.resumen(), archivo, indent=1, default=str)
+
+    def imprimir(self):
+        resumen = self.resumen()
+        print(f"Tiempo total: {resumen['segundos_totales']:.2f} s, memoria máxima: {resumen['rss_pico_mb'] or 0:.0f} MB")
+        for nombre, etapa in sorted(resumen["etapas"].items(), key=lambda elemento: -elemento[1]["segundos"]):
+            print(f"  {nombre:<22} {etapa['segundos']:8.2f} s  {etapa['llamadas']:6d} llamadas  {etapa['rss_pico_mb'] or 0:6.0f} MB máx.")
+
+def medir(metricas, nombre):
+    # Contexto que mide la etapa 'nombre' cuando hay métricas, y no hace nada si no las hay
+    return metricas.etapa(nombre) if metricas is not None else nullcontext()
 
 # Función para agregar una cabecera al documento
 def agregar_cabecera(doc):
@@ -84,79 +372,414 @@ def apply_font_format(cell, bold=False, font_color=None, alignment=WD_ALIGN_PARA
         run.font.color.rgb = font_color
     paragraph.alignment = alignment
 
-def leer_datos_desde_excel(ruta_excel, ruta_excel_calles):
-    # Leer el archivo Excel y cargarlo en un DataFrame de pandas
-    df = pd.read_excel(ruta_excel)
+# Abreviaturas de tipo de vía (ya sin acentos ni puntuación) y su forma completa, para que
+# "Av. Diagonal" y "Avinguda Diagonal" se comparen igual. El tipo de vía no se elimina: "Plaça de
+# Catalunya" y "Rambla de Catalunya" son calles distintas.
+ABREVIATURAS_VIA = {
+    "c": "carrer", "cr": "carrer", "av": "avinguda", "avda": "avinguda", "pg": "passeig",
+    "ptge": "passatge", "pl": "placa", "pca": "placa", "rbla": "rambla", "rda": "ronda",
+    "trav": "travessera", "bda": "baixada", "jard": "jardins",
+}
+
+def normalizar_texto(texto):
+    # Pasar a minúsculas, quitar acentos y cambiar la puntuación y los guiones bajos por espacios
+    import pandas as pd
+    if pd.isna(texto):
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto).lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(re.sub(r"[\W_]+", " ", texto).split())
+
+def normalizar_nombre_via(nombre):
+    # Normalizar el nombre y escribir las abreviaturas de tipo de vía en su forma completa
+    return ' '.join(ABREVIATURAS_VIA.get(palabra, palabra) for palabra in normalizar_texto(nombre).split())
+
+# Caché de los Excel ya leídos: leer un .xlsx grande con openpyxl es lo más lento de la lectura,
+# así que se guarda el DataFrame (solo las columnas que usa el informe) en un pickle junto con el
+# tamaño y la fecha de modificación del Excel. Si el archivo no ha cambiado se carga el pickle.
+CARPETA_CACHE_EXCEL = os.path.join(os.path.expanduser("~"), ".cache", "stjust", "excel")
+VERSION_CACHE_EXCEL = "1"
+
+# Columnas que usa el informe de cada Excel
+COLUMNAS_CALLES = ["NOM_VIA", "BARRI"]
+COLUMNAS_AUDITORIA = [
+    "_title", "lloc", "lloc_thoroughfare", "data", "imatges", "_latitude", "_longitude",
+    "edifici", "sala", "numero_de_planta", "num_incidencia",
+] + [f"{i}_{sufijo}" for sufijo in ("tipus_de_desperfecte", "amidament", "unitats", "tipus_operacio", "interferencia") for i in range(1, 4)]
+
+def leer_excel_con_cache(ruta_excel, columnas, carpeta_cache=CARPETA_CACHE_EXCEL):
+    # Lee solo 'columnas' del Excel; con carpeta_cache=None no se usa la caché
+    estado = os.stat(ruta_excel)
+    firma = [VERSION_CACHE_EXCEL, estado.st_size, estado.st_mtime_ns]
+    ruta_cache = None
+    if carpeta_cache:
+        # Un archivo por Excel y juego de columnas; se sobrescribe cuando el Excel cambia
+        clave = hashlib.sha1(json.dumps([os.path.abspath(ruta_excel), sorted(columnas)]).encode("utf-8")).hexdigest()
+        ruta_cache = os.path.join(carpeta_cache, clave + ".pkl")
+        try:
+            with open(ruta_cache, "rb") as archivo:
+                guardado = pickle.load(archivo)
+            if guardado["firma"] == firma:
+                return guardado["df"]
+        except FileNotFoundError:
+            pass
+        except Exception as error:
+            print(f"Caché del Excel ilegible, se vuelve a leer {ruta_excel}: {error}")
+
+    import pandas as pd
+    buscadas = set(columnas)
+    df = pd.read_excel(ruta_excel, usecols=lambda columna: columna in buscadas)
+
+    if ruta_cache:
+        # Escribir en un temporal y renombrar, para no dejar nunca un pickle a medias
+        os.makedirs(carpeta_cache, exist_ok=True)
+        temporal = f"{ruta_cache}.{os.getpid()}.tmp"
+        with open(temporal, "wb") as archivo:
+            pickle.dump({"firma": firma, "df": df}, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, ruta_cache)
+    return df
+
+class IndiceCalles:
+    # Índice de calles construido una sola vez a partir del Excel de calles y barrios.
+    # Usa un autómata de Aho-Corasick sobre los nombres normalizados para encontrar en una sola
+    # pasada todas las calles contenidas en un 'lloc_thoroughfare', y se queda con la primera
+    # calle del registro (la de menor posición), igual que el bucle original: basta con que el
+    # nombre de la calle esté contenido en la dirección, como en "nom_via in lloc_thoroughfare".
+    def __init__(self, nombres_via, barris):
+        self.barris = list(barris)
+        self._transiciones = [{}]
+        self._fallos = [0]
+        self._salidas = [None]  # Menor posición de calle que termina en cada estado
+        self._posicion_vacia = None  # Un NOM_VIA vacío coincide con cualquier dirección
+        self._resueltos = {}
+
+        for posicion, nombre in enumerate(nombres_via):
+            clave = normalizar_nombre_via(nombre)
+            if not clave:
+                if self._posicion_vacia is None:
+                    self._posicion_vacia = posicion
+                continue
+            self._insertar(clave, posicion)
+        self._construir_fallos()
+
+    @classmethod
+    def desde_dataframe(cls, df_calles):
+        return cls(df_calles['NOM_VIA'].tolist(), df_calles['BARRI'].tolist())
+
+    @classmethod
+    def desde_excel(cls, ruta_excel_calles, carpeta_cache=CARPETA_CACHE_EXCEL):
+        return cls.desde_dataframe(leer_excel_con_cache(ruta_excel_calles, COLUMNAS_CALLES, carpeta_cache))
+
+    def _insertar(self, patron, posicion):
+        estado = 0
+        for caracter in patron:
+            siguiente = self._transiciones[estado].get(caracter)
+            if siguiente is None:
+                siguiente = len(self._transiciones)
+                self._transiciones[estado][caracter] = siguiente
+                self._transiciones.append({})
+                self._fallos.append(0)
+                self._salidas.append(None)
+            estado = siguiente
+        if self._salidas[estado] is None or posicion < self._salidas[estado]:
+            self._salidas[estado] = posicion
+
+    def _construir_fallos(self):
+        # Recorrido en anchura: cada estado hereda la menor salida de su enlace de fallo
+        cola = list(self._transiciones[0].values())
+        for estado in cola:
+            for caracter, siguiente in self._transiciones[estado].items():
+                fallo = self._fallos[estado]
+                while fallo and caracter not in self._transiciones[fallo]:
+                    fallo = self._fallos[fallo]
+                destino = self._transiciones[fallo].get(caracter, 0)
+                self._fallos[siguiente] = destino if destino != siguiente else 0
+                salida_fallo = self._salidas[self._fallos[siguiente]]
+                if salida_fallo is not None and (self._salidas[siguiente] is None or salida_fallo < self._salidas[siguiente]):
+                    self._salidas[siguiente] = salida_fallo
+                cola.append(siguiente)
+
+    def _primera_posicion(self, texto):
+        mejor = self._posicion_vacia
+        estado = 0
+        for caracter in texto:
+            while estado and caracter not in self._transiciones[estado]:
+                estado = self._fallos[estado]
+            estado = self._transiciones[estado].get(caracter, 0)
+            salida = self._salidas[estado]
+            if salida is not None and (mejor is None or salida < mejor):
+                mejor = salida
+        return mejor
+
+    def buscar_barri(self, lloc_thoroughfare):
+        # Devuelve el barrio de la primera calle del registro contenida en la dirección, o ''
+        clave = normalizar_nombre_via(lloc_thoroughfare)
+        if clave not in self._resueltos:
+            posicion = self._primera_posicion(clave)
+            self._resueltos[clave] = self.barris[posicion] if posicion is not None else ''
+        return self._resueltos[clave]
+
+    def asignar_barris(self, serie_thoroughfare):
+        # Resolver cada dirección distinta una sola vez y repartir el resultado a todas las filas
+        return serie_thoroughfare.map(self.buscar_barri).fillna('')
+
+class IndiceBarriosGeo:
+    # Asignación del barrio por coordenadas: el barrio es el del polígono (de un GeoJSON con los
+    # límites de los barrios) que contiene el punto. Para no comparar cada punto con todos los
+    # polígonos, el rectángulo que cubre todos los barrios se divide en una rejilla y cada celda guarda
+    # los polígonos cuyo rectángulo la toca; un punto solo se prueba contra los de su celda.
+    # La prueba es la del rayo (par-impar) sobre todas las aristas del polígono a la vez con numpy,
+    # así que los huecos y los multipolígonos funcionan sin tratarlos aparte.
+    # Si un punto cae en varios polígonos gana el primero del archivo.
+    CAMPOS_BARRI = ("BARRI", "NOM_BARRI", "nom_barri", "NOM", "nom", "name")
+
+    def __init__(self, barris, poligonos, celdas_por_lado=64):
+        # barris[i] es el nombre del polígono i, y poligonos[i] su lista de anillos [(longitud, latitud), ...]
+        import numpy as np
+        self.barris = list(barris)
+        self._aristas = []  # Por polígono: x1, y1, x2, y2 de todas las aristas de todos sus anillos
+        self._cajas = []  # Por polígono: (x mínima, y mínima, x máxima, y máxima)
+        for anillos in poligonos:
+            inicios, finales = [], []
+            for anillo in anillos:
+                puntos = np.asarray(anillo, dtype=float)[:, :2]
+                inicios.append(puntos)
+                finales.append(np.roll(puntos, -1, axis=0))
+            inicios, finales = np.concatenate(inicios), np.concatenate(finales)
+            self._aristas.append((inicios[:, 0], inicios[:, 1], finales[:, 0], finales[:, 1]))
+            self._cajas.append((*inicios.min(axis=0), *inicios.max(axis=0)))
+
+        # Rejilla de celdas_por_lado x celdas_por_lado sobre el rectángulo que cubre todos los barrios
+        self._rejilla = {}
+        if not self._cajas:
+            return
+        self._x0 = min(caja[0] for caja in self._cajas)
+        self._y0 = min(caja[1] for caja in self._cajas)
+        self._ancho_celda = (max(caja[2] for caja in self._cajas) - self._x0) / celdas_por_lado or 1.0
+        self._alto_celda = (max(caja[3] for caja in self._cajas) - self._y0) / celdas_por_lado or 1.0
+        for posicion, (x_min, y_min, x_max, y_max) in enumerate(self._cajas):
+            (i_min, j_min), (i_max, j_max) = self._celda(x_min, y_min), self._celda(x_max, y_max)
+            for i in range(i_min, i_max + 1):
+                for j in range(j_min, j_max + 1):
+                    self._rejilla.setdefault((i, j), []).append(posicion)
+
+    @classmethod
+    def desde_geojson(cls, ruta_geojson, campo_barri=None):
+        # Lee los Polygon y MultiPolygon del GeoJSON; el nombre del barrio sale de la propiedad
+        # campo_barri o, si no se indica, de la primera de CAMPOS_BARRI que exista
+        with open(ruta_geojson, encoding="utf-8") as archivo:
+            geojson = json.load(archivo)
+        barris, poligonos = [], []
+        for elemento in geojson.get("features", [geojson]):
+            geometria = elemento.get("geometry") or {}
+            if geometria.get("type") == "Polygon":
+                anillos = geometria["coordinates"]
+            elif geometria.get("type") == "MultiPolygon":
+                anillos = [anillo for poligono in geometria["coordinates"] for anillo in poligono]
+            else:
+                continue
+            anillos = [anillo for anillo in anillos if len(anillo) >= 3]
+            if not anillos:
+                continue
+            propiedades = elemento.get("properties") or {}
+            campo = campo_barri or next((nombre for nombre in cls.CAMPOS_BARRI if nombre in propiedades), None)
+            if campo is None:
+                raise ValueError(f"{ruta_geojson}: no se encuentra el nombre del barrio en las propiedades {sorted(propiedades)}")
+            barris.append(propiedades[campo])
+            poligonos.append(anillos)
+        return cls(barris, poligonos)
+
+    def _celda(self, x, y):
+        return int((x - self._x0) // self._ancho_celda), int((y - self._y0) // self._alto_celda)
+
+    def buscar_barri(self, latitud, longitud):
+        # Barrio del polígono que contiene el punto, o '' si no hay coordenadas o no cae en ninguno
+        import numpy as np
+        try:
+            x, y = float(longitud), float(latitud)
+        except (TypeError, ValueError):
+            return ''
+        if math.isnan(x) or math.isnan(y) or not self._rejilla:
+            return ''
+        for posicion in self._rejilla.get(self._celda(x, y), ()):
+            x_min, y_min, x_max, y_max = self._cajas[posicion]
+            if not (x_min <= x <= x_max and y_min <= y <= y_max):
+                continue
+            x1, y1, x2, y2 = self._aristas[posicion]
+            # Aristas que cruzan la horizontal del punto y, de ellas, las que quedan a su derecha
+            cruzan = (y1 > y) != (y2 > y)
+            x1, y1, x2, y2 = x1[cruzan], y1[cruzan], x2[cruzan], y2[cruzan]
+            cortes = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+            if np.count_nonzero(cortes > x) % 2:
+                return self.barris[posicion]
+        return ''
+
+    def asignar_barris(self, latitudes, longitudes):
+        # Barrio de cada punto ('' si no se encuentra); cada coordenada distinta se resuelve una vez
+        resueltos = {}
+        barris = []
+        for punto in zip(latitudes, longitudes):
+            if punto not in resueltos:
+                resueltos[punto] = self.buscar_barri(*punto)
+            barris.append(resueltos[punto])
+        return barris
+
+# Datos de una incidencia tal como los usa crear_tablas_informes
+class DatosIncidencia(NamedTuple):
+    titulo: str
+    lloc: str
+    lloc_thoroughfare: str
+    fecha: object
+    imatges: str
+    latitud: float
+    longitud: float
+    barri: str
+    edifici: object
+    sala: object
+    numero_de_planta: object
+    desperfectos: list
+    amidaments: list
+    unitats: list
+    propuestas: list
+    interferencias: list
+    num_incidencia: object
+
+def agrupar_columnas_por_ranura(df, sufijo, num_ranuras=3):
+    # Convierte las columnas "1_<sufijo>".."3_<sufijo>" en una lista por fila con los valores no vacíos,
+    # respetando el orden de las ranuras
+    import pandas as pd
+    matriz = df[[f"{i}_{sufijo}" for i in range(1, num_ranuras + 1)]].to_numpy(dtype=object)
+    presentes = pd.notna(matriz)
+    return [valores[mascara].tolist() for valores, mascara in zip(matriz, presentes)]
+
+def leer_datos_desde_excel(ruta_excel, ruta_excel_calles, indice_calles=None, carpeta_cache=CARPETA_CACHE_EXCEL, metricas=None, indice_barrios_geo=None):
+    # Leer del archivo Excel solo las columnas del informe (o cargarlas de la caché)
+    with medir(metricas, "lectura_excel"):
+        df = leer_excel_con_cache(ruta_excel, COLUMNAS_AUDITORIA, carpeta_cache)
+
+    # El índice de calles se puede reutilizar entre ejecuciones; si no se pasa, se construye aquí
+    if indice_calles is None:
+        with medir(metricas, "indice_calles"):
+            indice_calles = IndiceCalles.desde_excel(ruta_excel_calles, carpeta_cache)
+    with medir(metricas, "asignacion_barris"):
+        if indice_barrios_geo is not None:
+            # Por coordenadas; sin coordenadas (o si caen fuera de todos los barrios) se usa la calle
+            import pandas as pd
+            barris = pd.Series(indice_barrios_geo.asignar_barris(df['_latitude'].tolist(), df['_longitude'].tolist()), index=df.index, dtype=object)
+            sin_barri = barris == ''
+            if sin_barri.any():
+                barris[sin_barri] = indice_calles.asignar_barris(df.loc[sin_barri, 'lloc_thoroughfare'])
+            df['barri'] = barris
+        else:
+            df['barri'] = indice_calles.asignar_barris(df['lloc_thoroughfare'])
+
+    # Reagrupar las columnas de las ranuras 1..3 en listas por incidencia, sin recorrer fila a fila
+    desperfectos = agrupar_columnas_por_ranura(df, "tipus_de_desperfecte")
+    amidaments = agrupar_columnas_por_ranura(df, "amidament")
+    unitats = agrupar_columnas_por_ranura(df, "unitats")
+    propuestas = agrupar_columnas_por_ranura(df, "tipus_operacio")
+    interferencias = agrupar_columnas_por_ranura(df, "interferencia")
+
+    # Lista con un registro por fila
+    datos_filas = list(map(DatosIncidencia._make, zip(
+        df["_title"].tolist(),
+        [str(lloc) for lloc in df["lloc"].tolist()],
+        df["lloc_thoroughfare"].tolist(),
+        df["data"].tolist(),
+        df["imatges"].tolist(),
+        df["_latitude"].tolist(),
+        df["_longitude"].tolist(),
+        df["barri"].tolist(),
+        df["edifici"].tolist(),
+        df["sala"].tolist(),
+        df["numero_de_planta"].tolist(),
+        desperfectos, amidaments, unitats, propuestas, interferencias,
+        df["num_incidencia"].tolist(),
+    )))
 
-    df_calles = pd.read_excel(ruta_excel_calles)
-    df['barri'] = ''
-
-    for index, row in df.iterrows():
-        lloc_thoroughfare = row['lloc_thoroughfare'].lower() if pd.notna(row['lloc_thoroughfare']) else ''
-        for _, calle_row in df_calles.iterrows():
-            nom_via = calle_row['NOM_VIA'].lower() if pd.notna(calle_row['NOM_VIA']) else ''
-            if nom_via in lloc_thoroughfare:
-                df.at[index, 'barri'] = calle_row['BARRI']
-                break
-
-    # Lista para almacenar los datos de cada fila
-    datos_filas = []
-
-    # Leer los datos de cada fila y agregarlos a la lista
-    for _, fila in df.iterrows():
-        # Recogiendo los datos necesarios de la fila
-        titulo = fila["_title"]
-        lloc = str(fila["lloc"])
-        lloc_thoroughfare = fila["lloc_thoroughfare"] 
-        fecha = fila["data"]
-        imatges = fila["imatges"]
-        latitud = fila["_latitude"]
-        longitud = fila["_longitude"]
-        barri = fila["barri"] 
-        edifici = fila["edifici"] 
-        sala = fila["sala"] 
-        numero_de_planta = fila["numero_de_planta"]
-
-        #Num rubatec 
-        
-        num_incidencia = fila["num_incidencia"]    
-
-        # Recogiendo los tipos de operaciones y las interferencias, solo si existen (no son NaN)
-        desperfectos = []
-        amidament = []
-        unitats = []
-        interferencias = []
-        propuestas = []
-        for i in range(1, 4):
-            if pd.notna(fila[f"{i}_tipus_de_desperfecte"]):
-                desperfectos.append(fila[f"{i}_tipus_de_desperfecte"])
-            if pd.notna(fila[f"{i}_amidament"]):
-                amidament.append(fila[f"{i}_amidament"])
-            if pd.notna(fila[f"{i}_unitats"]):
-                unitats.append(fila[f"{i}_unitats"])           
-            if pd.notna(fila[f"{i}_tipus_operacio"]):
-                propuestas.append(fila[f"{i}_tipus_operacio"])            
-            if pd.notna(fila[f"{i}_interferencia"]):
-                interferencias.append(fila[f"{i}_interferencia"])
-        # Agregar la fila de datos a la lista
-        datos_filas.append((
-            titulo, lloc, lloc_thoroughfare, fecha, imatges, latitud, longitud, barri,
-            edifici, sala, numero_de_planta,desperfectos, amidament,unitats, propuestas , interferencias, num_incidencia
-        ))
-        
     return datos_filas
 
-def agregar_imagen_en_celda(celda, ruta_imagen):
+class RegistroImagenes:
+    # Inserta imágenes en el cuerpo de un documento registrando cada imagen una sola vez.
+    # python-docx ya comparte la parte de imagen entre imágenes iguales, pero en cada add_picture
+    # vuelve a leer el archivo, recalcula el SHA1 de todas las imágenes ya guardadas y busca el
+    # siguiente id, nombre de parte y rId recorriendo todo lo anterior, lo que es cuadrático.
+    # Aquí se llevan esos índices y contadores a mano: cada ruta se lee una vez y cada imagen
+    # distinta se guarda en una sola parte compartida.
+    def __init__(self, doc):
+        self._parte = doc.part
+        self._paquete = self._parte.package
+        self._imagenes = {}  # ruta -> (rId, imagen)
+        self._por_sha1 = {}  # sha1 -> (rId, imagen)
+        for rel in self._parte.rels.values():
+            if rel.reltype == RT.IMAGE and not rel.is_external:
+                self._por_sha1[rel.target_part.sha1] = (rel.rId, rel.target_part.image)
+        self._siguiente_id = self._parte.next_id
+        self._siguiente_rid = len(self._parte.rels) + 1
+        self._siguiente_parte = max((parte.partname.idx or 0 for parte in self._paquete.image_parts), default=0) + 1
+
+    def registrar(self, imagen_o_ruta, reutilizar=True):
+        # Devuelve el (rId, imagen) de la parte de imagen, creándola si es nueva.
+        # Con reutilizar=False no se recuerda la ruta (para temporales cuyo nombre puede repetirse).
+        entrada = self._imagenes.get(imagen_o_ruta) if reutilizar else None
+        if entrada is not None:
+            return entrada
+        imagen = DocxImage.from_file(imagen_o_ruta)
+        entrada = self._por_sha1.get(imagen.sha1)
+        if entrada is None:
+            partname = PackURI(f"/word/media/image{self._siguiente_parte}.{imagen.ext}")
+            self._siguiente_parte += 1
+            parte_imagen = ImagePart.from_image(imagen, partname)
+            self._paquete.image_parts.append(parte_imagen)
+            while f"rId{self._siguiente_rid}" in self._parte.rels:
+                self._siguiente_rid += 1
+            rId = f"rId{self._siguiente_rid}"
+            self._parte.rels.add_relationship(RT.IMAGE, parte_imagen, rId)
+            entrada = self._por_sha1[imagen.sha1] = (rId, imagen)
+        if reutilizar:
+            self._imagenes[imagen_o_ruta] = entrada
+        return entrada
+
+    def nuevo_id(self):
+        # Id único para el siguiente dibujo del documento
+        self._siguiente_id += 1
+        return self._siguiente_id - 1
+
+    def agregar(self, run, ruta_imagen, width=None, height=None, reutilizar=True):
+        rId, imagen = self.registrar(ruta_imagen, reutilizar)
+        cx, cy = imagen.scaled_dimensions(width, height)
+        inline = CT_Inline.new_pic_inline(self.nuevo_id(), rId, imagen.filename, cx, cy)
+        run._r.add_drawing(inline)
+
+    @property
+    def num_partes(self):
+        # Número de imágenes distintas guardadas en el documento
+        return len({parte.partname for parte in self._paquete.image_parts})
+
+def agregar_imagen_en_celda(celda, ruta_imagen, registro_imagenes=None, reutilizar=True):
     # Crear un párrafo en la celda
     paragraph = celda.paragraphs[0]
     run = paragraph.add_run()
     # Añadir la imagen al párrafo de la celda
-    run.add_picture(ruta_imagen, width=Inches(3))
+    if registro_imagenes is not None:
+        registro_imagenes.agregar(run, ruta_imagen, width=Inches(3), reutilizar=reutilizar)
+    else:
+        run.add_picture(ruta_imagen, width=Inches(3))
     paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
 
 
+# Zoom y tamaño en píxeles de las imágenes de geolocalización
+ZOOM_MAPA = 19
+ANCHO_MAPA = 800
+ALTO_MAPA = 600
+
+# Versiones de los renderizadores; cambiarlas invalida los mapas guardados en la caché
+VERSION_MAPA_FOLIUM = "folium-1"
+VERSION_MAPA_ESTATICO = "estatico-1"
+
 def generar_mapa_folium(latitud, longitud):
-    mapa = folium.Map(location=[latitud, longitud], max_zoom=19, zoom_start=19)
+    import folium
+    mapa = folium.Map(location=[latitud, longitud], max_zoom=19, zoom_start=ZOOM_MAPA)
     
     # Agregar un marcador en la ubicación indicada por las coordenadas de latitud y longitud
     folium.Marker([latitud, longitud]).add_to(mapa)
@@ -168,7 +791,107 @@ def generar_mapa_folium(latitud, longitud):
 
     return mapa_html.name
 
+TAMANO_TESELA = 256
+
+class OrigenTeselas:
+    # Teselas de mapa locales para el renderizador estático, sin navegador ni red.
+    # Acepta una carpeta con la estructura {z}/{x}/{y}.png (o .jpg) o un archivo MBTiles.
+    # Hay que llamar a cerrar al terminar para cerrar el MBTiles y soltar las teselas guardadas.
+    def __init__(self, ruta, max_teselas=256):
+        self.ruta = ruta
+        self.max_teselas = max_teselas
+        self._teselas = OrderedDict()  # (z, x, y) -> imagen, de la usada hace más tiempo a la más reciente
+        self._bloqueo = threading.Lock()
+        self._conexion = None
+        self._es_mbtiles = os.path.isfile(ruta) and ruta.lower().endswith('.mbtiles')
+        if self._es_mbtiles:
+            self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        elif not os.path.isdir(ruta):
+            raise FileNotFoundError(f"No se encuentra el origen de teselas: {ruta}")
+
+    def _leer_bytes(self, z, x, y):
+        if self._es_mbtiles:
+            # MBTiles guarda las filas en esquema TMS (eje y invertido)
+            with self._bloqueo:
+                fila = self._conexion.execute(
+                    "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                    (z, x, (1 << z) - 1 - y)).fetchone()
+            return fila[0] if fila else None
+        for extension in ('png', 'jpg', 'jpeg'):
+            ruta_tesela = os.path.join(self.ruta, str(z), str(x), f"{y}.{extension}")
+            if os.path.exists(ruta_tesela):
+                with open(ruta_tesela, 'rb') as archivo:
+                    return archivo.read()
+        return None
+
+    def tesela(self, z, x, y):
+        # Las incidencias cercanas comparten teselas, así que se guardan las últimas max_teselas decodificadas
+        clave = (z, x, y)
+        with self._bloqueo:
+            if clave in self._teselas:
+                self._teselas.move_to_end(clave)
+                return self._teselas[clave]
+        from PIL import Image
+        datos = self._leer_bytes(z, x, y)
+        imagen = None
+        if datos is not None:
+            imagen = Image.open(io.BytesIO(datos))
+            imagen.load()
+            imagen = imagen.convert('RGB')
+        with self._bloqueo:
+            self._teselas[clave] = imagen
+            self._teselas.move_to_end(clave)
+            while len(self._teselas) > self.max_teselas:
+                self._teselas.popitem(last=False)
+        return imagen
+
+    def cerrar(self):
+        with self._bloqueo:
+            self._teselas.clear()
+            if self._conexion is not None:
+                self._conexion.close()
+                self._conexion = None
+
+def dibujar_marcador(dibujo, x, y):
+    # Marcador tipo Leaflet: gota azul con la punta en (x, y) y un círculo blanco en el centro
+    radio = 11
+    centro_y = y - 27
+    dibujo.polygon([(x, y), (x - radio + 2, centro_y + 5), (x + radio - 2, centro_y + 5)], fill=(42, 129, 203), outline=(49, 104, 150))
+    dibujo.ellipse([x - radio, centro_y - radio, x + radio, centro_y + radio], fill=(42, 129, 203), outline=(49, 104, 150))
+    dibujo.ellipse([x - 4, centro_y - 4, x + 4, centro_y + 4], fill=(255, 255, 255))
+
+def generar_mapa_estatico(latitud, longitud, origen_teselas, zoom=ZOOM_MAPA, ancho=ANCHO_MAPA, alto=ALTO_MAPA):
+    # Alternativa a Folium + Selenium: componer el mapa directamente en un PNG a partir de teselas
+    # locales, con el mismo zoom y tamaño que la captura del navegador. Devuelve la ruta del PNG.
+    from PIL import Image, ImageDraw
+    escala = TAMANO_TESELA * (1 << zoom)
+    seno_latitud = math.sin(math.radians(latitud))
+    centro_x = (longitud + 180.0) / 360.0 * escala
+    centro_y = (0.5 - math.log((1 + seno_latitud) / (1 - seno_latitud)) / (4 * math.pi)) * escala
+    origen_x = int(round(centro_x - ancho / 2))
+    origen_y = int(round(centro_y - alto / 2))
+
+    # Fondo gris como el de Leaflet para las teselas que falten
+    imagen = Image.new('RGB', (ancho, alto), (221, 221, 221))
+    num_teselas = 1 << zoom
+    for tesela_y in range(origen_y // TAMANO_TESELA, (origen_y + alto - 1) // TAMANO_TESELA + 1):
+        if not 0 <= tesela_y < num_teselas:
+            continue
+        for tesela_x in range(origen_x // TAMANO_TESELA, (origen_x + ancho - 1) // TAMANO_TESELA + 1):
+            tesela = origen_teselas.tesela(zoom, tesela_x % num_teselas, tesela_y)
+            if tesela is not None:
+                if tesela.size != (TAMANO_TESELA, TAMANO_TESELA):
+                    tesela = tesela.resize((TAMANO_TESELA, TAMANO_TESELA))
+                imagen.paste(tesela, (tesela_x * TAMANO_TESELA - origen_x, tesela_y * TAMANO_TESELA - origen_y))
+
+    dibujar_marcador(ImageDraw.Draw(imagen), int(round(centro_x)) - origen_x, int(round(centro_y)) - origen_y)
+
+    ruta_imagen = tempfile.mktemp(suffix=".png")
+    imagen.save(ruta_imagen)
+    return ruta_imagen
+
 def crear_driver_web():
+    from selenium import webdriver
     # Determinar la ruta del directorio actual del script o ejecutable
     base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
 
@@ -182,21 +905,253 @@ def crear_driver_web():
     # Crear y retornar el driver de Chrome sin especificar la ruta
     return webdriver.Chrome(options=options)
 
-def crear_bloque_desperfecto(tabla, i, desperfecto, amidament,unitats, interferencia, propuesta):
+def capturar_mapa_html(driver, ruta_html, ruta_png, ancho=ANCHO_MAPA, alto=ALTO_MAPA):
+    # Cargar el mapa HTML en el navegador y guardar una captura en PNG
+    driver.get("file:///" + ruta_html)
+    driver.set_window_size(ancho, alto)
+    driver.save_screenshot(ruta_png)
+
+class PoolNavegadores:
+    # Mantiene abiertas una o varias sesiones de Chrome y las reutiliza entre incidencias,
+    # en lugar de arrancar y cerrar un navegador por cada mapa.
+    # Las sesiones se crean bajo demanda y, si una se cae, se descarta y se abre otra.
+    # Un hilo que espera sesión se despierta tanto si se libera una como si se descarta: en ese
+    # caso abre él una nueva (y ve el error si tampoco se puede).
+    def __init__(self, num_navegadores=1, fabrica=crear_driver_web, max_reintentos=1):
+        self.num_navegadores = num_navegadores
+        self.max_reintentos = max_reintentos
+        self._fabrica = fabrica
+        self._libres = []  # Sesiones abiertas que nadie está usando
+        self._creados = 0
+        self._condicion = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def _obtener(self):
+        with self._condicion:
+            # Si todas las sesiones están ocupadas, esperar a que se libere o se descarte una
+            while not self._libres and self._creados >= self.num_navegadores:
+                self._condicion.wait()
+            if self._libres:
+                return self._libres.pop()
+            self._creados += 1
+        try:
+            return self._fabrica()
+        except Exception:
+            self._liberar_plaza()
+            raise
+
+    def _devolver(self, driver):
+        with self._condicion:
+            self._libres.append(driver)
+            self._condicion.notify()
+
+    def _liberar_plaza(self):
+        with self._condicion:
+            self._creados -= 1
+            self._condicion.notify()
+
+    def _descartar(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        self._liberar_plaza()
+
+    def capturar(self, ruta_html, ruta_png, ancho=ANCHO_MAPA, alto=ALTO_MAPA):
+        from selenium.common.exceptions import WebDriverException
+        for intento in range(self.max_reintentos + 1):
+            driver = self._obtener()
+            try:
+                capturar_mapa_html(driver, ruta_html, ruta_png, ancho, alto)
+            except WebDriverException:
+                self._descartar(driver)
+                if intento == self.max_reintentos:
+                    raise
+                print("La sesión del navegador ha fallado, se reinicia")
+            else:
+                self._devolver(driver)
+                return
+
+    def cerrar(self):
+        with self._condicion:
+            libres, self._libres = self._libres, []
+        for driver in libres:
+            self._descartar(driver)
+
+def generar_imagen_geolocalizacion(latitud, longitud, pool_navegadores=None):
+    # Generar el mapa con Folium y capturarlo como PNG. Sin pool se usa un navegador nuevo
+    # para esta incidencia y se cierra al terminar (comportamiento original).
+    print("Generando mapa con Folium")
+    mapa_html_file = generar_mapa_folium(latitud, longitud)
+    print("Mapa generado: ", mapa_html_file)
+    ruta_imagen_geolocalizacion = tempfile.mktemp(suffix=".png")
+    try:
+        if pool_navegadores is not None:
+            pool_navegadores.capturar(mapa_html_file, ruta_imagen_geolocalizacion)
+        else:
+            driver = crear_driver_web()
+            try:
+                capturar_mapa_html(driver, mapa_html_file, ruta_imagen_geolocalizacion)
+            finally:
+                driver.quit()
+    finally:
+        os.remove(mapa_html_file)
+    return ruta_imagen_geolocalizacion
+
+CARPETA_CACHE_MAPAS = os.path.join(os.path.expanduser("~"), ".cache", "stjust", "mapas")
+
+class CacheMapas:
+    # Caché persistente en disco de las imágenes de geolocalización ya renderizadas.
+    # La clave es un hash de (latitud y longitud redondeadas, zoom, tamaño, versión del renderizador),
+    # y cuando la carpeta supera tamano_maximo bytes se borran los mapas usados hace más tiempo.
+    def __init__(self, carpeta=CARPETA_CACHE_MAPAS, tamano_maximo=500 * 1024 * 1024, decimales=6):
+        self.carpeta = carpeta
+        self.tamano_maximo = tamano_maximo
+        self.decimales = decimales
+        self.aciertos = 0
+        self.fallos = 0
+        self._bloqueo = threading.Lock()
+        os.makedirs(carpeta, exist_ok=True)
+
+        # Índice en memoria: nombre de archivo -> (último uso, tamaño)
+        self._entradas = {}
+        for entrada in os.scandir(carpeta):
+            if entrada.is_file() and entrada.name.endswith(".png"):
+                estado = entrada.stat()
+                self._entradas[entrada.name] = (estado.st_mtime, estado.st_size)
+        self._tamano_total = sum(tamano for _, tamano in self._entradas.values())
+
+    def clave(self, latitud, longitud, version, zoom=ZOOM_MAPA, ancho=ANCHO_MAPA, alto=ALTO_MAPA):
+        texto = f"{round(latitud, self.decimales)}|{round(longitud, self.decimales)}|{zoom}|{ancho}x{alto}|{version}"
+        return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:32] + ".png"
+
+    def envolver(self, renderizador_mapas, version, zoom=ZOOM_MAPA, ancho=ANCHO_MAPA, alto=ALTO_MAPA):
+        # Devuelve un renderizador con la misma interfaz que consulta la caché antes de renderizar.
+        # Siempre devuelve una copia temporal, porque quien lo llama borra el PNG tras insertarlo.
+        def renderizar_con_cache(latitud, longitud):
+            nombre = self.clave(latitud, longitud, version, zoom, ancho, alto)
+            ruta_cache = os.path.join(self.carpeta, nombre)
+            ruta_imagen = tempfile.mktemp(suffix=".png")
+            with self._bloqueo:
+                acierto = nombre in self._entradas
+                if acierto:
+                    self.aciertos += 1
+                    self._entradas[nombre] = (time.time(), self._entradas[nombre][1])
+                else:
+                    self.fallos += 1
+            if acierto:
+                try:
+                    shutil.copyfile(ruta_cache, ruta_imagen)
+                    os.utime(ruta_cache)
+                    return ruta_imagen
+                except OSError:
+                    # El archivo ha desaparecido de la carpeta: renderizar de nuevo
+                    with self._bloqueo:
+                        self._entradas.pop(nombre, None)
+
+            ruta_renderizada = renderizador_mapas(latitud, longitud)
+            self._guardar(nombre, ruta_renderizada)
+            return ruta_renderizada
+        return renderizar_con_cache
+
+    def _guardar(self, nombre, ruta_imagen):
+        ruta_cache = os.path.join(self.carpeta, nombre)
+        # Copiar primero a un temporal de la misma carpeta para que el reemplazo sea atómico
+        ruta_parcial = ruta_cache + f".{threading.get_ident()}.tmp"
+        shutil.copyfile(ruta_imagen, ruta_parcial)
+        os.replace(ruta_parcial, ruta_cache)
+        tamano = os.path.getsize(ruta_cache)
+        with self._bloqueo:
+            anterior = self._entradas.get(nombre)
+            if anterior is not None:
+                self._tamano_total -= anterior[1]
+            self._entradas[nombre] = (time.time(), tamano)
+            self._tamano_total += tamano
+            self._expulsar()
+
+    def _expulsar(self):
+        # Borrar los mapas menos usados recientemente hasta volver por debajo del límite
+        if self._tamano_total <= self.tamano_maximo:
+            return
+        for nombre, (_, tamano) in sorted(self._entradas.items(), key=lambda item: item[1][0]):
+            if self._tamano_total <= self.tamano_maximo:
+                break
+            try:
+                os.remove(os.path.join(self.carpeta, nombre))
+            except OSError:
+                pass
+            del self._entradas[nombre]
+            self._tamano_total -= tamano
+
+def renderizar_mapas_geolocalizacion(datos_filas, num_trabajadores=1, pool_navegadores=None, renderizador_mapas=None, control=None):
+    # Generar las imágenes de geolocalización de todas las incidencias en paralelo, antes de montar
+    # el documento. Devuelve las rutas de los PNG en el mismo orden que datos_filas.
+    # renderizador_mapas es cualquier función (latitud, longitud) -> ruta del PNG; por defecto Folium + Chrome.
+    if renderizador_mapas is None:
+        renderizador_mapas = partial(generar_imagen_geolocalizacion, pool_navegadores=pool_navegadores)
+    with ThreadPoolExecutor(max_workers=num_trabajadores) as ejecutor:
+        futuros = [
+            ejecutor.submit(renderizador_mapas, datos.latitud, datos.longitud)
+            for datos in datos_filas
+        ]
+        try:
+            rutas_mapas = []
+            for futuro in futuros:
+                rutas_mapas.append(futuro.result())
+                avanzar(control, "Renderizando mapas", len(rutas_mapas), len(futuros))
+            return rutas_mapas
+        except BaseException:
+            # Si falla alguna captura, no dejar en disco los PNG que sí se han generado
+            for futuro in futuros:
+                futuro.cancel()
+            for futuro in futuros:
+                if not futuro.cancelled() and futuro.exception() is None:
+                    os.remove(futuro.result())
+            raise
+
+def celda(tabla, fila, columna):
+    # Acceso directo a una celda por su posición en el XML (más rápido que tabla.cell, que recalcula
+    # toda la cuadrícula). En las filas combinadas solo existe la columna 0.
+    return _Cell(tabla._tbl.tr_lst[fila].tc_lst[columna], tabla)
+
+def poner_texto(celda, texto):
+    # Cambiar el texto de una celda ya formateada conservando el formato de su primer run
+    paragraph = celda.paragraphs[0]
+    if paragraph.runs:
+        paragraph.runs[0].text = texto
+    else:
+        paragraph.add_run(texto)
+
+def agregar_fila_dato(tabla, titulo, valor, plantillas=None):
+    # Fila título (azul) / valor (gris), clonada de la plantilla si se pasa una
+    if plantillas is not None:
+        row_cells = plantillas.agregar_fila(tabla, plantillas.fila_dato)
+        poner_texto(row_cells[0], titulo)
+        poner_texto(row_cells[1], str(valor))
+        return
+    row_cells = tabla.add_row().cells
+    row_cells[0].text = titulo
+    set_background_color(row_cells[0], '548DD4')
+    apply_font_format(row_cells[0], bold=True, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER)
+    row_cells[1].text = str(valor)
+    set_background_color(row_cells[1], 'BFBFBF')
+    apply_font_format(row_cells[1], alignment=WD_ALIGN_PARAGRAPH.CENTER)  # Formato por defecto en negro BFBFBF
+
+def crear_bloque_desperfecto(tabla, i, desperfecto, amidament,unitats, interferencia, propuesta, plantillas=None):
     # Asumiendo que 'tabla' es un objeto de tabla de python-docx
     titles = ["Desperfecte", "Amidament", "Interferència/afecció amb altres usos públics", "Proposta d'activitat"]
     values = [desperfecto, f"{amidament} {unitats}", interferencia, propuesta]
 
     for title, value in zip(titles, values):
-        row_cells = tabla.add_row().cells
-        row_cells[0].text = f"{title} {i+1}" if title == "Desperfecte" else title
-        set_background_color(row_cells[0], '548DD4')
-        apply_font_format(row_cells[0], bold=True, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER)
-        row_cells[1].text = str(value)
-        set_background_color(row_cells[1], 'BFBFBF')
-        apply_font_format(row_cells[1], alignment=WD_ALIGN_PARAGRAPH.CENTER)  # Formato por defecto en negro BFBFBF
-
-def add_building_info(tabla, edifici, sala, numero_de_planta):
+        agregar_fila_dato(tabla, f"{title} {i+1}" if title == "Desperfecte" else title, value, plantillas)
+
+def add_building_info(tabla, edifici, sala, numero_de_planta, plantillas=None):
+    import pandas as pd
     if pd.isna(edifici):
         return
 
@@ -204,242 +1159,1058 @@ def add_building_info(tabla, edifici, sala, numero_de_planta):
     info_values = [edifici, sala, numero_de_planta]
 
     for title, value in zip(info_titles, info_values):
-        row = tabla.add_row().cells
-        row[0].text = title
-        set_background_color(row[0], '548DD4')
-        apply_font_format(row[0], bold=True, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER)
-        row[1].text = str(value)
-        set_background_color(row[1], 'BFBFBF')
-        apply_font_format(row[1], alignment=WD_ALIGN_PARAGRAPH.CENTER)   
+        agregar_fila_dato(tabla, title, value, plantillas)
+
+def agregar_fila_titulo_grafica(tabla, plantillas=None):
+    # Fila "INCIDÈNCIA GRÀFICA" sobre las fotos
+    if plantillas is not None:
+        plantillas.agregar_fila(tabla, plantillas.fila_titulo_grafica)
+        return
+    celdas_titulo_incidencia = tabla.add_row().cells
+    celda_titulo_incidencia = celdas_titulo_incidencia[0].merge(celdas_titulo_incidencia[1])
+    celda_titulo_incidencia.text = "INCIDÈNCIA GRÀFICA"
+    set_background_color(celda_titulo_incidencia, '002060')
+    apply_font_format(celda_titulo_incidencia, bold=True, font_size=15, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER)
+
+def construir_tabla_incidencia(doc):
+    # Tabla INCIDÈNCIA con títulos y formato, y las celdas de valores vacías
+    # (se rellenan después con poner_texto)
+
+    # Crear la tabla con 9 filas y 2 columnas
+    tabla = doc.add_table(rows=9, cols=2)
+    tabla.style = 'Table Grid'
+
+    # Configuración de las celdas de la tabla
+    for row in tabla.rows:
+        for cell in row.cells:
+            cell.width = Inches(3.5)
+
+    # Primera fila - "INCIDÈNCIA"
+    celda_encabezado = tabla.cell(0, 0)
+    celda_encabezado.merge(tabla.cell(0, 1))
+    celda_encabezado.text = ""
+    set_background_color(celda_encabezado, '002060')
+    apply_font_format(celda_encabezado, bold=True, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER, font_size=18)
+
+    # Fila fantasma
+    celda_fantasma = tabla.cell(1,0)
+    celda_fantasma.merge(tabla.cell(1,1))
+
+    #TITULO DE LA SEGUNDA FILA - DESCRIPCIÓ DE L'INCIDENCIA
+    celda_titulo_descripcio = tabla.cell(2,0)
+    celda_titulo_descripcio.merge(tabla.cell(2,1))
+    celda_titulo_descripcio.text = "DESCRIPCIÓ INCIDÈNCIA"
+    set_background_color(celda_titulo_descripcio, '002060')
+    apply_font_format(celda_titulo_descripcio, bold=True, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER, font_size=15)
+
+    #  Descripción de la incidencia
+    celda_descripcion = tabla.cell(3, 0)
+    celda_descripcion.merge(tabla.cell(3, 1))
+    celda_descripcion.text = ""
+    apply_font_format(celda_descripcion)  # Fuente por defecto en negro
+
+    #TITULO DE LOS DATOS - DADES
+    celda_titulo_dades = tabla.cell(4,0)
+    celda_titulo_dades.merge(tabla.cell(4,1))
+    celda_titulo_dades.text = "DADES"
+    set_background_color(celda_titulo_dades, '002060')
+    apply_font_format(celda_titulo_dades, bold=True, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER, font_size=15)
+
+    # "DATA", "BARRI", "LOCALITZACIÓ" y "ELEMENT AFECTAT"
+    for fila, titulo in enumerate(["DATA DETECCIÓ", "BARRI", "LOCALITZACIÓ", "ELEMENT AFECTAT"], start=5):
+        tabla.cell(fila, 0).text = titulo
+        set_background_color(tabla.cell(fila, 0), '548DD4')
+        apply_font_format(tabla.cell(fila, 0), bold=True, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER)
+        tabla.cell(fila, 1).text = ""
+        set_background_color(tabla.cell(fila, 1), 'BFBFBF')
+        apply_font_format(tabla.cell(fila, 1), alignment=WD_ALIGN_PARAGRAPH.CENTER)  # Fuente por defecto en negro
+
+    return tabla
+
+def construir_tabla_coordenadas(doc):
+    # Tabla COORDENADES con títulos y formato, sin valores ni imágenes
+    tabla2 = doc.add_table(rows=7, cols=2)
+
+    for row in tabla2.rows:
+        for cell in row.cells:
+            set_cell_border(cell, "FFFFFF")
+
+    coordenades = tabla2.cell(0,0).merge(tabla2.cell(0,1))
+    coordenades.text = "COORDENADES"
+    set_background_color(coordenades, '002060')
+    apply_font_format(coordenades, bold=True, font_color=RGBColor(255, 255, 255), font_size=15,alignment=WD_ALIGN_PARAGRAPH.CENTER)
+
+    for fila, titulo in enumerate(["LATITUD", "LONGITUD"], start=1):
+        tabla2.cell(fila,0).text = titulo
+        set_background_color(tabla2.cell(fila,0), '548DD4')
+        apply_font_format(tabla2.cell(fila,0), bold=True, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER)
+        tabla2.cell(fila,1).text = ""
+        set_background_color(tabla2.cell(fila,1), 'BFBFBF')
+        apply_font_format(tabla2.cell(fila,1), bold=True,  alignment=WD_ALIGN_PARAGRAPH.CENTER)
+
+    loc_geo = tabla2.cell(3,0).merge(tabla2.cell(3,1))
+    loc_geo.text = "LOCALITZACIÓ GRÀFICA"
+    set_background_color(loc_geo, '002060')
+    apply_font_format(loc_geo, bold=True,font_size=13, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER)
+
+    # Celda del mapa del barrio
+    tabla2.cell(4,0).merge(tabla2.cell(4,1))
+
+    geolocalitzacio = tabla2.cell(5,0).merge(tabla2.cell(5,1))
+    geolocalitzacio.text = "GEOLOCALITZACIÓ"
+    set_background_color(geolocalitzacio, '002060')
+    apply_font_format(geolocalitzacio, bold=True, font_size=13, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER)
+
+    # Celda del mapa de geolocalización
+    tabla2.cell(6,0).merge(tabla2.cell(6,1))
+
+    return tabla2
+
+class PlantillasTablas:
+    # Tablas y filas con todo el formato aplicado, construidas una sola vez por documento.
+    # Para cada incidencia se clona su XML y solo se rellenan los valores, en lugar de repetir
+    # los set_background_color / apply_font_format / set_cell_border celda a celda.
+    def __init__(self, doc):
+        self.incidencia = self._separar(construir_tabla_incidencia(doc))
+        self.coordenadas = self._separar(construir_tabla_coordenadas(doc))
+
+        tabla_filas = doc.add_table(rows=0, cols=2)
+        agregar_fila_dato(tabla_filas, "", "")
+        agregar_fila_titulo_grafica(tabla_filas)
+        tabla_filas.add_row()
+        self.fila_dato, self.fila_titulo_grafica, self.fila_vacia = tabla_filas._tbl.tr_lst
+        self._separar(tabla_filas)
+
+    @staticmethod
+    def _separar(tabla):
+        # Sacar la tabla del cuerpo del documento: solo se usa como molde
+        tabla._tbl.getparent().remove(tabla._tbl)
+        return tabla._tbl
+
+    @staticmethod
+    def clonar_tabla(doc, tbl):
+        copia = deepcopy(tbl)
+        doc.element.body._insert_tbl(copia)
+        return Table(copia, doc._body)
+
+    @staticmethod
+    def agregar_fila(tabla, tr):
+        copia = deepcopy(tr)
+        tabla._tbl.append(copia)
+        return [_Cell(tc, tabla) for tc in copia.tc_lst]
+
+    def nueva_tabla_incidencia(self, doc):
+        return self.clonar_tabla(doc, self.incidencia)
+
+    def nueva_tabla_coordenadas(self, doc):
+        return self.clonar_tabla(doc, self.coordenadas)
+
+class IndiceMapasBarrios:
+    # Índice de la carpeta de mapas de barrios, que se lee una sola vez.
+    # Un mapa corresponde a un barrio si el nombre normalizado del barrio aparece en el nombre
+    # normalizado del archivo, como hacía la búsqueda original (también "BarriGracia.jpg" para
+    # "Gracia"). Si hay varios candidatos se prefieren los que lo contienen como palabras completas,
+    # después el de nombre más corto y, a igualdad, el primero por orden alfabético.
+    def __init__(self, carpeta_mapas_barrios):
+        self.carpeta = carpeta_mapas_barrios
+        self._mapas = sorted(
+            (f" {normalizar_texto(os.path.splitext(entrada.name)[0])} ", entrada.name)
+            for entrada in os.scandir(carpeta_mapas_barrios)
+            if entrada.is_file() and entrada.name.lower().endswith('.jpg')
+        )
+        self._resueltos = {}
+
+    def buscar(self, barri):
+        # Ruta del mapa del barrio, o None si no hay ninguno
+        clave = normalizar_texto(barri)
+        if not clave:
+            return None
+        if clave not in self._resueltos:
+            candidatos = [(f" {clave} " not in nombre, len(nombre), archivo) for nombre, archivo in self._mapas if clave in nombre]
+            self._resueltos[clave] = os.path.join(self.carpeta, min(candidatos)[2]) if candidatos else None
+        return self._resueltos[clave]
+
+    def barris_sin_mapa(self, barris):
+        # Barrios (sin repetir y en orden de aparición) para los que no hay mapa en la carpeta.
+        # Las incidencias sin barrio asignado no cuentan.
+        return [barri for barri in dict.fromkeys(barris) if normalizar_texto(barri) and self.buscar(barri) is None]
+
+    def avisar_barris_sin_mapa(self, barris):
+        faltantes = self.barris_sin_mapa(barris)
+        for barri in faltantes:
+            print(f"Aviso: no hay mapa para el barrio '{barri}' en {self.carpeta}")
+        return faltantes
 
 def agregar_imagen_mapa_barrio(doc, barri, carpeta_mapas_barrios):
-    for archivo in os.listdir(carpeta_mapas_barrios):
-        if archivo.lower().endswith('.jpg') and barri.lower() in archivo.lower():
-            ruta_imagen_barrio = os.path.join(carpeta_mapas_barrios, archivo)
-            if os.path.exists(ruta_imagen_barrio):
-                paragraph = doc.add_paragraph()
-                run = paragraph.add_run()
-                run.add_picture(ruta_imagen_barrio, width=Inches(3.0))
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                break  # Salir del bucle una vez que se encuentra y agrega la imagen correspondiente   
+    ruta_imagen_barrio = obtener_ruta_imagen_barrio(barri, carpeta_mapas_barrios)
+    if ruta_imagen_barrio:
+        paragraph = doc.add_paragraph()
+        run = paragraph.add_run()
+        run.add_picture(ruta_imagen_barrio, width=Inches(3.0))
+        paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
 
 def obtener_ruta_imagen_barrio(barri, carpeta_mapas_barrios):
-    for archivo in os.listdir(carpeta_mapas_barrios):
-        if archivo.lower().endswith('.jpg') and barri.lower() in archivo.lower():
-            return os.path.join(carpeta_mapas_barrios, archivo)
-    return None            
+    # Para varias incidencias es mejor construir un IndiceMapasBarrios y reutilizarlo
+    return IndiceMapasBarrios(carpeta_mapas_barrios).buscar(barri)
+
+
+# Archivo de salida del informe
+RUTA_INFORME = "informes_word.docx"
+
+# Alto con el que se muestran las fotos de la incidencia en el documento
+ALTO_FOTO_PULGADAS = 3.0
+CARPETA_CACHE_FOTOS = os.path.join(os.path.expanduser("~"), ".cache", "stjust", "fotos")
+
+def rutas_fotos_incidencia(datos, carpeta_imagenes):
+    # Rutas de las dos primeras fotos de la incidencia (pueden no existir)
+    identificadores_imagenes = datos.imatges.split(",")[:2]  # Tomar los dos primeros identificadores
+    return [os.path.join(carpeta_imagenes, f"{identificador}.jpg") for identificador in identificadores_imagenes]
+
+def optimizar_foto(ruta_origen, ruta_destino, alto_px, calidad):
+    # Reducir la foto al alto en píxeles con el que se va a mostrar y recomprimirla en JPEG.
+    # Se ejecuta en un proceso aparte. Devuelve la ruta a usar en el documento.
+    from PIL import Image
+    with Image.open(ruta_origen) as imagen:
+        if imagen.height <= alto_px:
+            return ruta_origen
+        ancho_px = max(1, round(imagen.width * alto_px / imagen.height))
+        # Se conserva el EXIF (incluida la orientación) para que Word la muestre igual que la original
+        exif = imagen.info.get("exif")
+        reducida = imagen.convert("RGB").resize((ancho_px, alto_px), Image.LANCZOS)
+    ruta_parcial = f"{ruta_destino}.{os.getpid()}.tmp"
+    reducida.save(ruta_parcial, "JPEG", quality=calidad, optimize=True, **({"exif": exif} if exif else {}))
+    os.replace(ruta_parcial, ruta_destino)
+    return ruta_destino
+
+def expulsar_fotos(carpeta_cache, tamano_maximo, en_uso=()):
+    # Borrar las fotos reducidas usadas hace más tiempo hasta que carpeta_cache quede por debajo de
+    # tamano_maximo bytes, como en CacheMapas. Las de en_uso (las del informe en curso) no se borran.
+    fotos = []
+    for entrada in os.scandir(carpeta_cache):
+        if entrada.is_file() and entrada.name.endswith(".jpg"):
+            estado = entrada.stat()
+            fotos.append((estado.st_mtime, estado.st_size, entrada.path))
+    tamano_total = sum(tamano for _, tamano, _ in fotos)
+    for _, tamano, ruta in sorted(fotos):
+        if tamano_total <= tamano_maximo:
+            break
+        if ruta in en_uso:
+            continue
+        try:
+            os.remove(ruta)
+        except OSError:
+            continue
+        tamano_total -= tamano
+
+def preparar_fotos(rutas, carpeta_cache=CARPETA_CACHE_FOTOS, dpi=150, calidad=85, num_procesos=None, control=None, ejecutor=None,
+                   tamano_maximo=1024 * 1024 * 1024):
+    # Etapa previa al montaje del documento: reduce en paralelo todas las fotos que se van a insertar.
+    # El resultado se guarda en carpeta_cache con el hash del archivo original y de los parámetros,
+    # de modo que en las siguientes ejecuciones no se vuelve a procesar ninguna foto. Cuando la
+    # carpeta supera tamano_maximo bytes se borran las fotos usadas hace más tiempo.
+    # Devuelve un diccionario ruta original -> ruta a insertar.
+    # Con ejecutor se usa ese grupo de procesos (que no se cierra) en lugar de crear uno nuevo.
+    os.makedirs(carpeta_cache, exist_ok=True)
+    alto_px = round(ALTO_FOTO_PULGADAS * dpi)
+    fotos_optimizadas = {}
+    pendientes = {}
+    for ruta in dict.fromkeys(rutas):
+        if not os.path.exists(ruta):
+            continue
+        with open(ruta, "rb") as archivo:
+            resumen = hashlib.sha256(archivo.read())
+        resumen.update(f"|{alto_px}|{calidad}".encode("utf-8"))
+        ruta_cache = os.path.join(carpeta_cache, resumen.hexdigest()[:32] + ".jpg")
+        try:
+            # La fecha de modificación es la del último uso (ver expulsar_fotos)
+            os.utime(ruta_cache)
+            fotos_optimizadas[ruta] = ruta_cache
+        except OSError:
+            pendientes[ruta] = ruta_cache
+
+    if pendientes:
+        print(f"Reduciendo {len(pendientes)} fotos ({len(fotos_optimizadas)} ya estaban en la caché)")
+        with nullcontext(ejecutor) if ejecutor is not None else ProcessPoolExecutor(max_workers=num_procesos) as ejecutor:
+            futuros = {
+                ruta: ejecutor.submit(optimizar_foto, ruta, ruta_cache, alto_px, calidad)
+                for ruta, ruta_cache in pendientes.items()
+            }
+            try:
+                for hechas, (ruta, futuro) in enumerate(futuros.items(), start=1):
+                    fotos_optimizadas[ruta] = futuro.result()
+                    avanzar(control, "Reduciendo fotos", hechas, len(futuros))
+            except BaseException:
+                for futuro in futuros.values():
+                    futuro.cancel()
+                raise
+    expulsar_fotos(carpeta_cache, tamano_maximo, set(fotos_optimizadas.values()))
+    return fotos_optimizadas
+
+def agregar_incidencia(doc, datos, ruta_imagen_geolocalizacion, carpeta_imagenes, indice_mapas_barrios, registro_imagenes, plantillas=None, fotos_optimizadas=None):
+    # Añade al documento las dos tablas (INCIDÈNCIA y COORDENADES) de una incidencia
+    fotos_optimizadas = fotos_optimizadas or {}
+
+    # Dividir el título en elementos
+    elementos = datos.titulo.split(", ")
+
+    tabla = plantillas.nueva_tabla_incidencia(doc) if plantillas else construir_tabla_incidencia(doc)
+
+    # Primera fila - "INCIDÈNCIA"
+    poner_texto(celda(tabla, 0, 0), "INCIDÈNCIA Nº "+ str(datos.num_incidencia))
+
+    #  Descripción de la incidencia
+    descripcion_incidencia = ", ".join([f"{elem} {desp}" for elem, desp in zip(elementos, datos.desperfectos)]) + f" a {datos.lloc_thoroughfare}"
+    poner_texto(celda(tabla, 3, 0), str(descripcion_incidencia))
+
+    # "DATA", "BARRI", "LOCALITZACIÓ" y "ELEMENT AFECTAT"
+    poner_texto(celda(tabla, 5, 1), str(datos.fecha))
+    poner_texto(celda(tabla, 6, 1), str(datos.barri))
+    poner_texto(celda(tabla, 7, 1), str(datos.lloc_thoroughfare))
+    poner_texto(celda(tabla, 8, 1), str(datos.titulo))
+
+    add_building_info(tabla, datos.edifici, datos.sala, datos.numero_de_planta, plantillas)
+
+    for i, (desperfecto, amdt, unit, interf, prop) in enumerate(zip(datos.desperfectos, datos.amidaments, datos.unitats, datos.interferencias, datos.propuestas)):
+        crear_bloque_desperfecto(tabla, i, desperfecto, amdt, unit, interf, prop, plantillas)
+
+    #INCIDÈNCIA GRÀFICA
+    agregar_fila_titulo_grafica(tabla, plantillas)
+
+    # Agregar imágenes dentro de la tabla (la versión reducida si se ha preparado)
+    rutas_fotos = rutas_fotos_incidencia(datos, carpeta_imagenes)
+    if len(rutas_fotos) > 0:
+        row_imagenes = plantillas.agregar_fila(tabla, plantillas.fila_vacia) if plantillas else tabla.add_row().cells
+        for i, ruta_imagen in enumerate(rutas_fotos):
+            if os.path.exists(ruta_imagen):
+                run = row_imagenes[i].paragraphs[0].add_run()
+                ruta_foto = fotos_optimizadas.get(ruta_imagen, ruta_imagen)
+                if not os.path.exists(ruta_foto):
+                    # La reducida ha desaparecido de la caché (otra ejecución la ha expulsado): se usa la original
+                    ruta_foto = ruta_imagen
+                registro_imagenes.agregar(run, ruta_foto, height=Inches(ALTO_FOTO_PULGADAS))
+                row_imagenes[i].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    doc.add_page_break()
+
+    #--------------------------------------------------------------
+
+    # Crear la tabla 
+    tabla2 = plantillas.nueva_tabla_coordenadas(doc) if plantillas else construir_tabla_coordenadas(doc)
+
+    poner_texto(celda(tabla2, 1, 1), str(datos.latitud))
+    poner_texto(celda(tabla2, 2, 1), str(datos.longitud))
+
+    # AQUI DEBERIA PONER LA FOTO DE MAPA BARRIO
+    ruta_imagen_barrio = indice_mapas_barrios.buscar(datos.barri)
+    if ruta_imagen_barrio:
+        agregar_imagen_en_celda(celda(tabla2, 4, 0), ruta_imagen_barrio, registro_imagenes)
+
+    #AQUI DEBERIA PONER LA FOTO DE FOLIUM
+ 
+    # Agregar el mapa ya renderizado
+    agregar_imagen_en_celda(celda(tabla2, 6, 0), ruta_imagen_geolocalizacion, registro_imagenes, reutilizar=False)
+
+    # Agregar un salto de página después de cada tabla
+    doc.add_page_break()
+
+CARPETA_CACHE_FRAGMENTOS = os.path.join(os.path.expanduser("~"), ".cache", "stjust", "fragmentos")
+# Cambiarla invalida todos los fragmentos guardados (p. ej. al modificar el formato de las tablas)
+VERSION_FRAGMENTOS = "1"
+
+def describir_archivo(ruta):
+    # Ruta, tamaño y fecha de modificación: basta para detectar cambios sin leer el archivo
+    if not ruta or not os.path.exists(ruta):
+        return f"{ruta}|-"
+    estado = os.stat(ruta)
+    return f"{ruta}|{estado.st_size}|{estado.st_mtime_ns}"
+
+def huella_incidencia(datos, carpeta_imagenes, indice_mapas_barrios, contexto=""):
+    # Huella de todo lo que cambia el resultado de una incidencia: los datos de su fila, sus fotos,
+    # el mapa de su barrio y el contexto (renderizador de mapas, resolución de las fotos...)
+    partes = [VERSION_FRAGMENTOS, contexto, repr(tuple(datos))]
+    partes.extend(describir_archivo(ruta) for ruta in rutas_fotos_incidencia(datos, carpeta_imagenes))
+    partes.append(describir_archivo(indice_mapas_barrios.buscar(datos.barri)))
+    return hashlib.sha256("\n".join(partes).encode("utf-8")).hexdigest()
+
+class CacheFragmentos:
+    # Caché de los fragmentos XML ya generados de cada incidencia, para regenerar solo las incidencias
+    # nuevas o modificadas. La huella de una incidencia cubre los datos de su fila, sus fotos y el mapa
+    # de su barrio, además de un contexto con las opciones que cambian el resultado (renderizador de
+    # mapas, resolución de las fotos...). Cada fragmento se guarda como JSON con el XML de sus tablas
+    # y las imágenes que usa, que se guardan aparte por su SHA1. Cuando la carpeta supera
+    # tamano_maximo bytes, expulsar borra los fragmentos usados hace más tiempo.
+    def __init__(self, carpeta=CARPETA_CACHE_FRAGMENTOS, contexto="", tamano_maximo=1024 * 1024 * 1024):
+        self.carpeta = carpeta
+        self.carpeta_imagenes = os.path.join(carpeta, "imagenes")
+        self.contexto = contexto
+        self.tamano_maximo = tamano_maximo
+        self.reutilizados = 0
+        self.generados = 0
+        os.makedirs(self.carpeta_imagenes, exist_ok=True)
+
+    def huella(self, datos, carpeta_imagenes, indice_mapas_barrios):
+        return huella_incidencia(datos, carpeta_imagenes, indice_mapas_barrios, self.contexto)
+
+    def _ruta(self, huella):
+        return os.path.join(self.carpeta, f"{huella}.json")
+
+    def existe(self, huella):
+        return os.path.exists(self._ruta(huella))
+
+    def cargar(self, huella):
+        # Devuelve None (y la incidencia se vuelve a generar) si el fragmento no se puede leer o falta
+        # alguna de sus imágenes, por ejemplo porque otra ejecución las ha expulsado de la caché
+        try:
+            with open(self._ruta(huella), encoding="utf-8") as archivo:
+                fragmento = json.load(archivo)
+            if not all(os.path.exists(os.path.join(self.carpeta_imagenes, nombre)) for nombre in fragmento["imagenes"].values()):
+                return None
+            # La fecha de modificación es la del último uso (ver expulsar)
+            os.utime(self._ruta(huella))
+            return fragmento
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    def guardar(self, huella, doc, elementos):
+        imagenes = {}
+        for elemento in elementos:
+            for blip in elemento.iter(qn('a:blip')):
+                rid = blip.get(qn('r:embed'))
+                if rid in imagenes:
+                    continue
+                parte_imagen = doc.part.related_parts[rid]
+                nombre = f"{parte_imagen.sha1}{os.path.splitext(parte_imagen.partname)[1]}"
+                ruta_imagen = os.path.join(self.carpeta_imagenes, nombre)
+                if not os.path.exists(ruta_imagen):
+                    # Temporal propio de cada proceso: varios pueden guardar la misma imagen a la vez
+                    ruta_parcial = f"{ruta_imagen}.{os.getpid()}.tmp"
+                    with open(ruta_parcial, "wb") as archivo:
+                        archivo.write(parte_imagen.blob)
+                    os.replace(ruta_parcial, ruta_imagen)
+                imagenes[rid] = nombre
+        fragmento = {
+            "xml": [etree.tostring(elemento, encoding="unicode") for elemento in elementos],
+            "imagenes": imagenes,
+        }
+        ruta_parcial = f"{self._ruta(huella)}.{os.getpid()}.tmp"
+        with open(ruta_parcial, "w", encoding="utf-8") as archivo:
+            json.dump(fragmento, archivo)
+        os.replace(ruta_parcial, self._ruta(huella))
+        self._marcar_imagenes(imagenes.values())
+        self.generados += 1
+
+    def _marcar_imagenes(self, nombres):
+        # Las imágenes de un fragmento se marcan como usadas después que su JSON (ver expulsar)
+        for nombre in set(nombres):
+            try:
+                os.utime(os.path.join(self.carpeta_imagenes, nombre))
+            except OSError:
+                pass
+
+    def insertar(self, doc, fragmento, registro_imagenes):
+        # Copiar el fragmento al final del cuerpo, volviendo a enlazar sus imágenes con este documento
+        sect_pr = doc.element.body.sectPr
+        for texto in fragmento["xml"]:
+            elemento = parse_xml(texto)
+            for blip in elemento.iter(qn('a:blip')):
+                nombre = fragmento["imagenes"][blip.get(qn('r:embed'))]
+                rid, _ = registro_imagenes.registrar(os.path.join(self.carpeta_imagenes, nombre))
+                blip.set(qn('r:embed'), rid)
+            for doc_pr in elemento.iter(qn('wp:docPr')):
+                doc_pr.set('id', str(registro_imagenes.nuevo_id()))
+            sect_pr.addprevious(elemento)
+        self._marcar_imagenes(fragmento["imagenes"].values())
+        self.reutilizados += 1
+
+    def expulsar(self):
+        # Borrar los fragmentos usados hace más tiempo hasta volver por debajo del límite. Cada vez
+        # que se usa un fragmento se actualiza la fecha de su JSON y después la de sus imágenes, así
+        # que las imágenes anteriores al fragmento más antiguo que queda ya no las usa ninguno.
+        # Solo se llama desde el proceso principal al terminar el informe, cuando ningún proceso de
+        # montaje puede estar leyendo fragmentos.
+        def archivos(carpeta, extension):
+            # (último uso, tamaño, ruta) de cada archivo, del usado hace más tiempo al más reciente
+            encontrados = []
+            for entrada in os.scandir(carpeta):
+                if entrada.is_file() and entrada.name.endswith(extension) and not entrada.name.endswith(".tmp"):
+                    estado = entrada.stat()
+                    encontrados.append((estado.st_mtime, estado.st_size, entrada.path))
+            return sorted(encontrados)
+        fragmentos = archivos(self.carpeta, ".json")
+        imagenes = archivos(self.carpeta_imagenes, "")
+        tamano_total = sum(tamano for _, tamano, _ in fragmentos + imagenes)
+        borrados = 0
+        imagenes_borradas = 0
+        while borrados < len(fragmentos) and tamano_total > self.tamano_maximo:
+            _, tamano, ruta = fragmentos[borrados]
+            borrados += 1
+            tamano_total -= tamano
+            limite = fragmentos[borrados][0] if borrados < len(fragmentos) else math.inf
+            while imagenes_borradas < len(imagenes) and imagenes[imagenes_borradas][0] < limite:
+                _, tamano_imagen, ruta_imagen = imagenes[imagenes_borradas]
+                imagenes_borradas += 1
+                tamano_total -= tamano_imagen
+                try:
+                    os.remove(ruta_imagen)
+                except OSError:
+                    pass
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+        if borrados:
+            print(f"Caché de fragmentos: {borrados} fragmentos antiguos borrados")
+
+    def guardar_manifiesto(self, ruta_salida, datos_filas, huellas):
+        # Junto al informe se guarda la huella de cada incidencia, para saber qué ha cambiado entre ejecuciones.
+        # Lo llama generar_informes una vez por informe, no cada bloque ni cada proceso de montaje.
+        ruta_manifiesto = ruta_salida + ".manifiesto.json"
+        anteriores = set()
+        if os.path.exists(ruta_manifiesto):
+            with open(ruta_manifiesto, encoding="utf-8") as archivo:
+                anteriores = {huella for _, huella in json.load(archivo)["incidencias"]}
+        manifiesto = {"incidencias": [[str(datos.num_incidencia), huella] for datos, huella in zip(datos_filas, huellas)]}
+        with open(ruta_manifiesto, "w", encoding="utf-8") as archivo:
+            json.dump(manifiesto, archivo, indent=1)
+        cambiadas = sum(1 for huella in huellas if huella not in anteriores)
+        print(f"Incidencias nuevas o modificadas: {cambiadas} de {len(huellas)} "
+              f"({self.generados} generadas, {self.reutilizados} reutilizadas de la caché)")
+
+def crear_tablas_informes(datos_filas,carpeta_imagenes,carpeta_mapas_barrios, pool_navegadores=None, num_trabajadores=1, renderizador_mapas=None, fotos_optimizadas=None, indice_mapas_barrios=None, ruta_salida=RUTA_INFORME, usar_plantillas=True, cache_fragmentos=None, control=None, metricas=None, mapas_renderizados=None):
+    # La carpeta de mapas de barrios se lee una sola vez para todo el documento
+    if indice_mapas_barrios is None:
+        indice_mapas_barrios = IndiceMapasBarrios(carpeta_mapas_barrios)
+    # fotos_optimizadas: ruta original -> ruta reducida, tal como la devuelve preparar_fotos
+    fotos_optimizadas = fotos_optimizadas or {}
+
+    # Las incidencias que ya estén en la caché de fragmentos se copian tal cual; solo se generan las demás
+    huellas = [None] * len(datos_filas)
+    if cache_fragmentos is not None:
+        huellas = [cache_fragmentos.huella(datos, carpeta_imagenes, indice_mapas_barrios) for datos in datos_filas]
+    if mapas_renderizados is not None:
+        # Quien ha renderizado los mapas ya ha decidido qué incidencias salen de la caché (las que no tienen mapa)
+        en_cache = [ruta is None for ruta in mapas_renderizados]
+    else:
+        en_cache = [huella is not None and cache_fragmentos.existe(huella) for huella in huellas]
+    pendientes = [datos for datos, esta in zip(datos_filas, en_cache) if not esta]
 
+    # Renderizar primero todos los mapas de geolocalización (en paralelo si num_trabajadores > 1),
+    # salvo que ya vengan renderizados: mapas_renderizados tiene uno por fila (None en las que están en la caché)
+    if mapas_renderizados is not None:
+        rutas_mapas = iter([ruta for ruta in mapas_renderizados if ruta is not None])
+    else:
+        with medir(metricas, "mapas"):
+            rutas_mapas = iter(renderizar_mapas_geolocalizacion(pendientes, num_trabajadores, pool_navegadores, renderizador_mapas, control))
 
-def crear_tablas_informes(datos_filas,carpeta_imagenes,carpeta_mapas_barrios):
     # Crear el objeto Document
     doc = Document()
-
-    # Crear una tabla para cada fila de datos
-    for datos in datos_filas:
-        
-        titulo, lloc, lloc_thoroughfare, fecha, imatges, latitud, longitud, barri, edifici, sala, numero_de_planta,desperfectos,amidaments,unitats, propuestas , interferencias, num_incidencia = datos
-
-        # Dividir el título en elementos
-        elementos = titulo.split(", ")
-
-        # Crear la tabla con 5 filas y 2 columnas
-        tabla = doc.add_table(rows=9, cols=2)
-        tabla.style = 'Table Grid'
-        
-        # Configuración de las celdas de la tabla
-        for row in tabla.rows:
-            for cell in row.cells:
-                cell.width = Inches(3.5)
-        
-        # Primera fila - "INCIDÈNCIA"
-        celda_encabezado = tabla.cell(0, 0)
-        celda_encabezado.merge(tabla.cell(0, 1))
-        celda_encabezado.text = "INCIDÈNCIA Nº "+ str(num_incidencia) 
-        set_background_color(celda_encabezado, '002060')
-        apply_font_format(celda_encabezado, bold=True, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER, font_size=18)
-
-        # Fila fantasma
-
-        celda_fantasma = tabla.cell(1,0)
-        celda_fantasma.merge(tabla.cell(1,1))
-
-        #TITULO DE LA SEGUNDA FILA - DESCRIPCIÓ DE L'INCIDENCIA
-
-        celda_titulo_descripcio = tabla.cell(2,0)
-        celda_titulo_descripcio.merge(tabla.cell(2,1))
-        celda_titulo_descripcio.text = "DESCRIPCIÓ INCIDÈNCIA"
-        set_background_color(celda_titulo_descripcio, '002060')
-        apply_font_format(celda_titulo_descripcio, bold=True, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER, font_size=15)
-
-        #  Descripción de la incidencia
-        celda_descripcion = tabla.cell(3, 0)
-        celda_descripcion.merge(tabla.cell(3, 1))
-        descripcion_incidencia = ", ".join([f"{elem} {desp}" for elem, desp in zip(elementos, desperfectos)]) + f" a {lloc_thoroughfare}"
-        celda_descripcion.text = str(descripcion_incidencia)
-        apply_font_format(celda_descripcion)  # Fuente por defecto en negro
-
-        #TITULO DE LOS DATOS - DADES
-
-        celda_titulo_dades = tabla.cell(4,0)
-        celda_titulo_dades.merge(tabla.cell(4,1))
-        celda_titulo_dades.text = "DADES"
-        set_background_color(celda_titulo_dades, '002060')
-        apply_font_format(celda_titulo_dades, bold=True, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER, font_size=15)
-
-        #  "DATA"
-        celda_data = tabla.cell(5, 0)
-        celda_data.text = "DATA DETECCIÓ"
-        set_background_color(celda_data, '548DD4')
-        apply_font_format(celda_data, bold=True, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER)
-        tabla.cell(5, 1).text = str(fecha)
-        set_background_color(tabla.cell(5, 1), 'BFBFBF')
-        apply_font_format(tabla.cell(5, 1), alignment=WD_ALIGN_PARAGRAPH.CENTER)  # Fuente por defecto en negro
-
-        # "BARRI"
-        celda_barri = tabla.cell(6, 0)
-        celda_barri.text = "BARRI"
-        set_background_color(celda_barri, '548DD4')
-        apply_font_format(celda_barri, bold=True, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER)
-        tabla.cell(6, 1).text = str(barri)
-        set_background_color(tabla.cell(6, 1), 'BFBFBF')
-        apply_font_format(tabla.cell(6, 1), alignment=WD_ALIGN_PARAGRAPH.CENTER)  # Fuente por defecto en negro
-
-        # "LOCALITZACIÓ"
-        celda_localitzacio = tabla.cell(7, 0)
-        celda_localitzacio.text = "LOCALITZACIÓ"
-        set_background_color(celda_localitzacio, '548DD4')
-        apply_font_format(celda_localitzacio, bold=True, font_color=RGBColor(255, 255, 255),alignment=WD_ALIGN_PARAGRAPH.CENTER)
-        tabla.cell(7, 1).text = str(lloc_thoroughfare)
-        set_background_color(tabla.cell(7, 1), 'BFBFBF')
-        apply_font_format(tabla.cell(7, 1), alignment=WD_ALIGN_PARAGRAPH.CENTER)  # Fuente por defecto en negro
-
-        # ELEMENT AFECTAT
-        celda_elem = tabla.cell(8, 0)
-        celda_elem.text = "ELEMENT AFECTAT"
-        set_background_color(celda_elem, '548DD4')
-        apply_font_format(celda_elem, bold=True, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER)
-        tabla.cell(8, 1).text = str(titulo)
-        set_background_color(tabla.cell(8, 1), 'BFBFBF')
-        apply_font_format(tabla.cell(8, 1), alignment=WD_ALIGN_PARAGRAPH.CENTER)  # Fuente por defecto en negro
-
-        
-        add_building_info(tabla, edifici, sala, numero_de_planta)
-
-        for i, (desperfecto, amdt, unit, interf, prop) in enumerate(zip(desperfectos, amidaments, unitats, interferencias, propuestas)):
-            crear_bloque_desperfecto(tabla, i, desperfecto, amdt, unit, interf, prop)
-
-        #INCIDÈNCIA GRÀFICA
-
-        celdas_titulo_incidencia = tabla.add_row().cells
-        celda_titulo_incidencia = celdas_titulo_incidencia[0].merge(celdas_titulo_incidencia[1])
-        celda_titulo_incidencia.text = "INCIDÈNCIA GRÀFICA"
-        set_background_color(celda_titulo_incidencia, '002060')
-        apply_font_format(celda_titulo_incidencia, bold=True, font_size=15, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER)
-            
-
-        # Agregar imágenes dentro de la tabla
-        identificadores_imagenes = imatges.split(",")[:2]  # Tomar los dos primeros identificadores
-        if len(identificadores_imagenes) > 0:
-            row_imagenes = tabla.add_row().cells
-            for i, identificador in enumerate(identificadores_imagenes):
-                ruta_imagen = os.path.join(carpeta_imagenes, f"{identificador}.jpg")
-                if os.path.exists(ruta_imagen):
-                    run = row_imagenes[i].paragraphs[0].add_run()
-                    run.add_picture(ruta_imagen, height=Inches(3.0))
-                    row_imagenes[i].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-        doc.add_page_break()
-
-        #--------------------------------------------------------------
-
-        # Crear la tabla 
-        tabla2 = doc.add_table(rows=7, cols=2)
-        tabla.style = 'Table Grid'
-
-        for row in tabla2.rows:
-            for cell in row.cells:
-                set_cell_border(cell, "FFFFFF")
-
-        coordenades = tabla2.cell(0,0).merge(tabla2.cell(0,1))
-        coordenades.text = "COORDENADES"
-        set_background_color(coordenades, '002060')
-        apply_font_format(coordenades, bold=True, font_color=RGBColor(255, 255, 255), font_size=15,alignment=WD_ALIGN_PARAGRAPH.CENTER)
-
-
-        tabla2.cell(1,0).text = "LATITUD" 
-        set_background_color(tabla2.cell(1,0), '548DD4')
-        apply_font_format(tabla2.cell(1,0), bold=True, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER)
-        
-        tabla2.cell(1,1).text = str(latitud) 
-        set_background_color(tabla2.cell(1,1), 'BFBFBF')
-        apply_font_format(tabla2.cell(1,1), bold=True,  alignment=WD_ALIGN_PARAGRAPH.CENTER)
-
-        tabla2.cell(2,0).text = "LONGITUD"
-        set_background_color(tabla2.cell(2,0), '548DD4')
-        apply_font_format(tabla2.cell(2,0), bold=True,font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER)
-
-        tabla2.cell(2,1).text = str(longitud)
-        set_background_color(tabla2.cell(2,1), 'BFBFBF')
-        apply_font_format(tabla2.cell(2,1), bold=True,  alignment=WD_ALIGN_PARAGRAPH.CENTER)
-
-        loc_geo = tabla2.cell(3,0).merge(tabla2.cell(3,1))
-        loc_geo.text = "LOCALITZACIÓ GRÀFICA"
-        set_background_color(loc_geo, '002060')
-        apply_font_format(loc_geo, bold=True,font_size=13, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER)
-
-        tabla2.cell(4,0).merge(tabla2.cell(4,1))
-
-        # AQUI DEBERIA PONER LA FOTO DE MAPA BARRIO
-        ruta_imagen_barrio = obtener_ruta_imagen_barrio(barri, carpeta_mapas_barrios)
-        if ruta_imagen_barrio:
-            agregar_imagen_en_celda(tabla2.cell(4, 0).merge(tabla2.cell(4, 1)), ruta_imagen_barrio)
-
-        geolocalitzacio = tabla2.cell(5,0).merge(tabla2.cell(5,1))
-        geolocalitzacio.text = "GEOLOCALITZACIÓ"
-        set_background_color(geolocalitzacio, '002060')
-        apply_font_format(geolocalitzacio, bold=True, font_size=13, font_color=RGBColor(255, 255, 255), alignment=WD_ALIGN_PARAGRAPH.CENTER)
-
-        #AQUI DEBERIA PONER LA FOTO DE FOLIUM
- 
-        # Generar y agregar el mapa
-        print("Generando mapa con Folium")
-        mapa_html_file = generar_mapa_folium(latitud, longitud)
-        print("Mapa generado: ", mapa_html_file)
-        options = Options()
-        options.add_argument('--headless')
-        driver = crear_driver_web()
-        driver.get("file:///" + mapa_html_file)
-        driver.set_window_size(800, 600)
-        ruta_imagen_geolocalizacion = tempfile.mktemp(suffix=".png")
-        driver.save_screenshot(ruta_imagen_geolocalizacion)
-        driver.quit()
-        os.remove(mapa_html_file)
-
-        agregar_imagen_en_celda(tabla2.cell(6,0).merge(tabla2.cell(6,1)), ruta_imagen_geolocalizacion) 
-
-        os.remove(ruta_imagen_geolocalizacion)
-
-        # Agregar un salto de página después de cada tabla
-        doc.add_page_break()
+    registro_imagenes = RegistroImagenes(doc)
+
+    # Con usar_plantillas las tablas se clonan de un molde ya formateado; si no, se formatean celda a celda
+    plantillas = PlantillasTablas(doc) if usar_plantillas else None
+
+    # Crear las tablas de cada fila de datos
+    cuerpo = doc.element.body
+    intervalo_memoria = None
+    try:
+        for numero, (datos, huella, esta) in enumerate(zip(datos_filas, huellas, en_cache), start=1):
+            avanzar(control, "Montando documento", numero, len(datos_filas))
+            inicio_incidencia = time.perf_counter()
+            intervalo_memoria = metricas.abrir_memoria() if metricas is not None else None
+            fragmento = cache_fragmentos.cargar(huella) if esta else None
+            if fragmento is not None:
+                cache_fragmentos.insertar(doc, fragmento, registro_imagenes)
+                if metricas is not None:
+                    segundos = time.perf_counter() - inicio_incidencia
+                    memoria = metricas.cerrar_memoria(intervalo_memoria)
+                    metricas.registrar("incidencia_cache", segundos, memoria)
+                    metricas.incidencia(datos.num_incidencia, segundos, "cache", memoria)
+                continue
+
+            inicio = len(cuerpo) - 1  # El último hijo del cuerpo es el sectPr
+            if esta:
+                # El fragmento no se ha podido leer: se vuelve a generar la incidencia completa
+                ruta_imagen_geolocalizacion = renderizar_mapas_geolocalizacion([datos], 1, pool_navegadores, renderizador_mapas)[0]
+            else:
+                ruta_imagen_geolocalizacion = next(rutas_mapas)
+            try:
+                agregar_incidencia(doc, datos, ruta_imagen_geolocalizacion, carpeta_imagenes, indice_mapas_barrios, registro_imagenes, plantillas, fotos_optimizadas)
+            finally:
+                os.remove(ruta_imagen_geolocalizacion)
+            if huella is not None:
+                cache_fragmentos.guardar(huella, doc, cuerpo[inicio:len(cuerpo) - 1])
+            if metricas is not None:
+                # Sin contar el mapa, que se ha renderizado antes en la etapa "mapas"
+                segundos = time.perf_counter() - inicio_incidencia
+                memoria = metricas.cerrar_memoria(intervalo_memoria)
+                metricas.registrar("incidencia", segundos, memoria)
+                metricas.incidencia(datos.num_incidencia, segundos, "generada", memoria)
+    finally:
+        if intervalo_memoria is not None:
+            metricas.cerrar_memoria(intervalo_memoria)
+        # Si el montaje se interrumpe (un error o una cancelación), no dejar en disco los mapas que no se han llegado a usar
+        for ruta in rutas_mapas:
+            if os.path.exists(ruta):
+                os.remove(ruta)
 
     # Agregar cabecera y pie de página
     agregar_cabecera(doc)
     agregar_pie_de_pagina(doc)
 
     # Guardar el documento en un archivo
-    doc.save("informes_word.docx")
-
-import tkinter as tk
-from tkinter import filedialog
-
-def generar_informes(ruta_excel, carpeta_imagenes, ruta_excel_calles, carpeta_mapas_barrios):
+    avanzar(control, "Guardando documento")
+    with medir(metricas, "guardar_docx"):
+        doc.save(ruta_salida)
+
+def sin_renderizador_mapas(latitud, longitud):
+    # Renderizador de los procesos de crear_tablas_informes_por_procesos, donde no hay navegador ni
+    # teselas: si hiciera falta un mapa (un fragmento de la caché ilegible) se avisa en lugar de abrir Chrome
+    raise RuntimeError(f"No se puede renderizar el mapa de ({latitud}, {longitud}) en un proceso de montaje: "
+                       "borre la caché de fragmentos y vuelva a generar el informe")
+
+def generar_parte_documento(filas, mapas_renderizados, ruta_parte, carpeta_imagenes, carpeta_mapas_barrios, opciones):
+    # Genera en un proceso aparte el .docx de un tramo de incidencias con sus mapas ya renderizados.
+    # Devuelve los fragmentos (reutilizados, generados) para sumarlos en el proceso principal.
+    crear_tablas_informes(filas, carpeta_imagenes, carpeta_mapas_barrios, ruta_salida=ruta_parte, mapas_renderizados=mapas_renderizados,
+                          renderizador_mapas=sin_renderizador_mapas, **opciones)
+    cache_fragmentos = opciones.get("cache_fragmentos")
+    return (cache_fragmentos.reutilizados, cache_fragmentos.generados) if cache_fragmentos is not None else (0, 0)
+
+def crear_tablas_informes_por_procesos(datos_filas, carpeta_imagenes, carpeta_mapas_barrios, num_procesos=None, pool_navegadores=None, num_trabajadores=1, renderizador_mapas=None,
+                                       fotos_optimizadas=None, indice_mapas_barrios=None, ruta_salida=RUTA_INFORME, usar_plantillas=True, cache_fragmentos=None, control=None, metricas=None):
+    # Igual que crear_tablas_informes, pero montando el documento en varios procesos: montar las tablas
+    # con python-docx es puro cálculo en Python y con un solo proceso se usa un único núcleo.
+    # Los mapas se renderizan aquí (el navegador no se puede compartir entre procesos); después
+    # datos_filas se divide en tramos consecutivos, cada proceso genera el .docx de su tramo y al
+    # final se unen en orden con fusionar_documentos. La cabecera, el pie y la configuración de
+    # página son las del primer tramo, que son las mismas que las de un documento generado de una vez.
+    num_procesos = min(num_procesos or os.cpu_count() or 1, len(datos_filas))
+    if num_procesos <= 1:
+        # Con una sola incidencia (o ninguna) no hay nada que repartir
+        return crear_tablas_informes(datos_filas, carpeta_imagenes, carpeta_mapas_barrios, pool_navegadores, num_trabajadores, renderizador_mapas,
+                                     fotos_optimizadas, indice_mapas_barrios, ruta_salida, usar_plantillas, cache_fragmentos, control, metricas)
+    if indice_mapas_barrios is None:
+        indice_mapas_barrios = IndiceMapasBarrios(carpeta_mapas_barrios)
+
+    huellas = [None] * len(datos_filas)
+    if cache_fragmentos is not None:
+        huellas = [cache_fragmentos.huella(datos, carpeta_imagenes, indice_mapas_barrios) for datos in datos_filas]
+    # Aquí se comprueba además que cada fragmento se pueda leer entero: en los procesos de montaje
+    # no se puede volver a renderizar el mapa de una incidencia
+    en_cache = [huella is not None and cache_fragmentos.cargar(huella) is not None for huella in huellas]
+    pendientes = [datos for datos, esta in zip(datos_filas, en_cache) if not esta]
+
+    with medir(metricas, "mapas"):
+        rutas_pendientes = iter(renderizar_mapas_geolocalizacion(pendientes, num_trabajadores, pool_navegadores, renderizador_mapas, control))
+    mapas_renderizados = [None if esta else next(rutas_pendientes) for esta in en_cache]
+
+    opciones = dict(fotos_optimizadas=fotos_optimizadas, indice_mapas_barrios=indice_mapas_barrios, usar_plantillas=usar_plantillas, cache_fragmentos=cache_fragmentos)
+    tamano_tramo = math.ceil(len(datos_filas) / num_procesos)
+    with tempfile.TemporaryDirectory() as carpeta_partes:
+        rutas_partes = []
+        try:
+            with medir(metricas, "partes_documento"), ProcessPoolExecutor(max_workers=num_procesos) as ejecutor:
+                futuros = []
+                for inicio in range(0, len(datos_filas), tamano_tramo):
+                    ruta_parte = os.path.join(carpeta_partes, f"parte_{len(futuros):03d}.docx")
+                    rutas_partes.append(ruta_parte)
+                    futuros.append(ejecutor.submit(
+                        generar_parte_documento, datos_filas[inicio:inicio + tamano_tramo], mapas_renderizados[inicio:inicio + tamano_tramo],
+                        ruta_parte, carpeta_imagenes, carpeta_mapas_barrios, opciones))
+                try:
+                    for hechas, futuro in enumerate(futuros, start=1):
+                        reutilizados, generados = futuro.result()
+                        if cache_fragmentos is not None:
+                            cache_fragmentos.reutilizados += reutilizados
+                            cache_fragmentos.generados += generados
+                        avanzar(control, "Montando documento", hechas, len(futuros))
+                except BaseException:
+                    for futuro in futuros:
+                        futuro.cancel()
+                    raise
+        finally:
+            # Los procesos borran cada mapa al usarlo; si algo ha fallado quedan los de los tramos sin terminar
+            for ruta in mapas_renderizados:
+                if ruta is not None and os.path.exists(ruta):
+                    os.remove(ruta)
+
+        avanzar(control, "Guardando documento")
+        with medir(metricas, "fusionar_partes"):
+            fusionar_documentos(rutas_partes, ruta_salida)
+
+def dividir_en_bloques(datos_filas, tamano_bloque=100, por_barri=False):
+    # Devuelve una lista de (nombre, filas): bloques consecutivos de tamano_bloque incidencias,
+    # o un bloque por barrio en el orden en que aparece cada barrio por primera vez
+    if por_barri:
+        grupos = {}
+        for datos in datos_filas:
+            grupos.setdefault(normalizar_texto(datos.barri).replace(' ', '_') or 'sense_barri', []).append(datos)
+        return [(f"barri_{nombre}", filas) for nombre, filas in grupos.items()]
+    return [
+        (f"bloque_{numero:04d}", datos_filas[inicio:inicio + tamano_bloque])
+        for numero, inicio in enumerate(range(0, len(datos_filas), tamano_bloque), start=1)
+    ]
+
+def fusionar_documentos(rutas_documentos, ruta_salida):
+    # Une varios .docx generados por crear_tablas_informes en uno solo, en el orden dado.
+    # Se conservan la cabecera, el pie y la configuración de página del primero; las imágenes
+    # de los demás se vuelven a registrar en el documento final (una parte por imagen distinta).
+    doc = Document(rutas_documentos[0])
+    registro_imagenes = RegistroImagenes(doc)
+    cuerpo = doc.element.body
+    sect_pr = cuerpo.sectPr
+    for ruta in rutas_documentos[1:]:
+        otro = Document(ruta)
+        nuevos_rids = {}
+        for elemento in otro.element.body.iterchildren():
+            if elemento.tag == qn('w:sectPr'):
+                continue
+            copia = deepcopy(elemento)
+            for blip in copia.iter(qn('a:blip')):
+                rid = blip.get(qn('r:embed'))
+                if rid not in nuevos_rids:
+                    parte_imagen = otro.part.related_parts[rid]
+                    nuevos_rids[rid], _ = registro_imagenes.registrar(io.BytesIO(parte_imagen.blob), reutilizar=False)
+                blip.set(qn('r:embed'), nuevos_rids[rid])
+            if sect_pr is not None:
+                sect_pr.addprevious(copia)
+            else:
+                cuerpo.append(copia)
+    # Cada documento numera sus imágenes desde 1: renumerarlas para que no se repitan los ids
+    for numero, doc_pr in enumerate(cuerpo.iter(qn('wp:docPr')), start=1):
+        doc_pr.set('id', str(numero))
+        doc_pr.set('name', f"Picture {numero}")
+    doc.save(ruta_salida)
+
+def crear_informes_por_bloques(datos_filas, carpeta_imagenes, carpeta_mapas_barrios, carpeta_salida, tamano_bloque=100, por_barri=False, fusionar=False, ruta_fusionado=RUTA_INFORME,
+                               contexto="", **opciones):
+    # Modo por bloques para auditorías grandes: cada bloque se genera y se guarda en su propio .docx
+    # dentro de carpeta_salida, así la memoria no crece con el número de incidencias y un fallo
+    # solo pierde el bloque en curso. En progreso.json se anota cada bloque terminado junto con
+    # una huella de sus incidencias (la de huella_incidencia, con sus fotos, mapas de barrio y el
+    # contexto de opciones); al volver a ejecutar se saltan los bloques ya hechos y sin cambios.
+    # Las demás opciones se pasan tal cual a crear_tablas_informes.
+    os.makedirs(carpeta_salida, exist_ok=True)
+    indice_mapas_barrios = opciones.get("indice_mapas_barrios")
+    if indice_mapas_barrios is None:
+        indice_mapas_barrios = opciones["indice_mapas_barrios"] = IndiceMapasBarrios(carpeta_mapas_barrios)
+    ruta_progreso = os.path.join(carpeta_salida, "progreso.json")
+    progreso = {}
+    if os.path.exists(ruta_progreso):
+        with open(ruta_progreso, encoding="utf-8") as archivo:
+            progreso = json.load(archivo)
+
+    rutas_bloques = []
+    for nombre, filas in dividir_en_bloques(datos_filas, tamano_bloque, por_barri):
+        ruta_bloque = os.path.join(carpeta_salida, f"{nombre}.docx")
+        rutas_bloques.append(ruta_bloque)
+        huellas = (huella_incidencia(datos, carpeta_imagenes, indice_mapas_barrios, contexto) for datos in filas)
+        huella = hashlib.sha256("\n".join(huellas).encode("utf-8")).hexdigest()
+        if progreso.get(nombre) == huella and os.path.exists(ruta_bloque):
+            print(f"Bloque {nombre} ya generado, se omite")
+            continue
+        print(f"Generando bloque {nombre} ({len(filas)} incidencias)")
+        crear_tablas_informes(filas, carpeta_imagenes, carpeta_mapas_barrios, ruta_salida=ruta_bloque, **opciones)
+        progreso[nombre] = huella
+        with open(ruta_progreso + ".tmp", "w", encoding="utf-8") as archivo:
+            json.dump(progreso, archivo, indent=1)
+        os.replace(ruta_progreso + ".tmp", ruta_progreso)
+
+    if fusionar and rutas_bloques:
+        print(f"Uniendo {len(rutas_bloques)} bloques en {ruta_fusionado}")
+        with medir(opciones.get("metricas"), "fusionar_bloques"):
+            fusionar_documentos(rutas_bloques, ruta_fusionado)
+    return rutas_bloques
+
+class RecursosInforme:
+    # Lo que no depende del Excel de la auditoría y se puede compartir entre varios informes: el índice
+    # de calles, el de mapas de barrios, los polígonos de barrios, el renderizador de mapas (con sus
+    # navegadores y su caché) y el grupo de procesos que reduce las fotos. generar_informes crea uno
+    # por ejecución si no se le pasa; generar_informes_lote crea uno solo para todo el lote.
+    # El renderizador de mapas es Folium + Chrome, el de teselas con ruta_teselas o el que se pase
+    # en renderizador_mapas.
+    # Se usa como contexto: al salir se cierran los navegadores y los procesos.
+    def __init__(self, ruta_excel_calles, carpeta_mapas_barrios, reutilizar_navegador=True, num_navegadores=1, ruta_teselas=None,
+                 carpeta_cache_mapas=CARPETA_CACHE_MAPAS, carpeta_cache_excel=CARPETA_CACHE_EXCEL, ruta_barrios_geojson=None, metricas=None,
+                 renderizador_mapas=None, version_mapas=None):
+        # Los arranques de navegador y los mapas renderizados cuentan en las métricas del informe en curso,
+        # que generar_informes cambia en cada ejecución
+        self.metricas = metricas
+        self.num_navegadores = num_navegadores
+        self._recursos = ExitStack()
+        self._ejecutor_fotos = None
+        with medir(metricas, "indice_calles"):
+            self.indice_calles = IndiceCalles.desde_excel(ruta_excel_calles, carpeta_cache_excel)
+        with medir(metricas, "indice_mapas_barrios"):
+            self.indice_mapas_barrios = IndiceMapasBarrios(carpeta_mapas_barrios)
+        # Con ruta_barrios_geojson el barrio se asigna por coordenadas y la calle queda de respaldo
+        self.indice_barrios_geo = None
+        if ruta_barrios_geojson:
+            with medir(metricas, "indice_barrios_geo"):
+                self.indice_barrios_geo = IndiceBarriosGeo.desde_geojson(ruta_barrios_geojson)
+
+        # Con carpeta_cache_mapas=None no se usa la caché de mapas
+        self.cache_mapas = CacheMapas(carpeta_cache_mapas) if carpeta_cache_mapas else None
+        if renderizador_mapas is not None:
+            # Cualquier función (latitud, longitud) -> ruta del PNG (pruebas, benchmarks...); version_mapas
+            # la distingue de los demás renderizadores en la caché de mapas y en las huellas de fragmentos
+            self.version_mapas = version_mapas or f"propio:{getattr(renderizador_mapas, '__qualname__', type(renderizador_mapas).__name__)}"
+        elif ruta_teselas:
+            # Mapas estáticos a partir de teselas locales: no hace falta navegador ni red
+            origen_teselas = OrigenTeselas(ruta_teselas)
+            self._recursos.callback(origen_teselas.cerrar)
+            renderizador_mapas = partial(generar_mapa_estatico, origen_teselas=origen_teselas)
+            self.version_mapas = f"{VERSION_MAPA_ESTATICO}:{os.path.abspath(ruta_teselas)}"
+        else:
+            # Sin reutilizar_navegador se abre un navegador nuevo por incidencia
+            fabrica = partial(self._medir_llamada, "arranque_navegador", crear_driver_web)
+            pool_navegadores = self._recursos.enter_context(PoolNavegadores(num_navegadores, fabrica)) if reutilizar_navegador else None
+            renderizador_mapas = partial(generar_imagen_geolocalizacion, pool_navegadores=pool_navegadores)
+            self.version_mapas = VERSION_MAPA_FOLIUM
+        # Solo cuentan los mapas que se renderizan de verdad, no los que salen de la caché
+        self.renderizador_mapas = partial(self._medir_llamada, "renderizar_mapa", renderizador_mapas)
+        if self.cache_mapas is not None:
+            self.renderizador_mapas = self.cache_mapas.envolver(self.renderizador_mapas, self.version_mapas)
+
+    def _medir_llamada(self, nombre, funcion, *args, **kwargs):
+        with medir(self.metricas, nombre):
+            return funcion(*args, **kwargs)
+
+    @property
+    def ejecutor_fotos(self):
+        # Los procesos no se arrancan hasta que se envía la primera foto
+        if self._ejecutor_fotos is None:
+            self._ejecutor_fotos = self._recursos.enter_context(ProcessPoolExecutor())
+        return self._ejecutor_fotos
+
+    def cerrar(self):
+        self._recursos.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        self.cerrar()
+
+def generar_informes(ruta_excel, carpeta_imagenes, ruta_excel_calles, carpeta_mapas_barrios, reutilizar_navegador=True, num_navegadores=1, ruta_teselas=None, carpeta_cache_mapas=CARPETA_CACHE_MAPAS, dpi_fotos=150, calidad_fotos=85,
+                     carpeta_bloques=None, tamano_bloque=100, por_barri=False, fusionar_bloques=False, carpeta_cache_fragmentos=CARPETA_CACHE_FRAGMENTOS,
+                     ruta_salida=RUTA_INFORME, control=None, carpeta_cache_excel=CARPETA_CACHE_EXCEL, carpeta_cache_fotos=CARPETA_CACHE_FOTOS,
+                     metricas=None, ruta_metricas=None, ruta_perfil=None, procesos_documento=1, ruta_barrios_geojson=None, recursos_informe=None,
+                     renderizador_mapas=None, version_mapas=None):
     print("Inicio de generar_informes")
-    datos_filas = leer_datos_desde_excel(ruta_excel, ruta_excel_calles)
-    crear_tablas_informes(datos_filas, carpeta_imagenes, carpeta_mapas_barrios)
+    # Con ruta_metricas se guarda al final un resumen JSON de tiempos y memoria por etapa
+    # (ver Metricas); con ruta_perfil, además, el perfil de cProfile del hilo principal.
+    if metricas is None and ruta_metricas:
+        metricas = Metricas()
+    with ExitStack() as recursos:
+        if metricas is not None:
+            recursos.callback(metricas.imprimir)
+            if ruta_metricas:
+                recursos.callback(metricas.guardar, ruta_metricas)
+        if ruta_perfil:
+            perfil = cProfile.Profile()
+            recursos.callback(perfil.dump_stats, ruta_perfil)
+            recursos.callback(perfil.disable)
+            perfil.enable()
+        recursos.enter_context(medir(metricas, "total"))
+
+        # Sin recursos_informe se crean aquí (calles, mapas de barrios, navegadores...) y se cierran al
+        # terminar; con él se reutilizan los de otro informe y se ignoran las opciones que los configuran
+        if recursos_informe is None:
+            recursos_informe = recursos.enter_context(RecursosInforme(
+                ruta_excel_calles, carpeta_mapas_barrios, reutilizar_navegador, num_navegadores, ruta_teselas,
+                carpeta_cache_mapas, carpeta_cache_excel, ruta_barrios_geojson, metricas, renderizador_mapas, version_mapas))
+        recursos_informe.metricas = metricas
+        cache_mapas = recursos_informe.cache_mapas
+        if cache_mapas is not None:
+            aciertos_previos, fallos_previos = cache_mapas.aciertos, cache_mapas.fallos
+
+        avanzar(control, "Leyendo Excel")
+        datos_filas = leer_datos_desde_excel(ruta_excel, ruta_excel_calles, recursos_informe.indice_calles, carpeta_cache_excel, metricas, recursos_informe.indice_barrios_geo)
+        # Avisar de los barrios sin mapa antes de empezar a renderizar
+        indice_mapas_barrios = recursos_informe.indice_mapas_barrios
+        indice_mapas_barrios.avisar_barris_sin_mapa(datos.barri for datos in datos_filas)
+
+        # Con carpeta_cache_fragmentos=None se regeneran siempre todas las incidencias
+        cache_fragmentos = None
+        huellas = None
+        pendientes = datos_filas
+        # Opciones que cambian el resultado de cada incidencia, para las huellas de fragmentos y bloques
+        contexto = f"{recursos_informe.version_mapas}|{dpi_fotos}|{calidad_fotos}"
+        if carpeta_cache_fragmentos:
+            cache_fragmentos = CacheFragmentos(carpeta_cache_fragmentos, contexto)
+            with medir(metricas, "huellas_fragmentos"):
+                huellas = [cache_fragmentos.huella(datos, carpeta_imagenes, indice_mapas_barrios) for datos in datos_filas]
+                pendientes = [datos for datos, huella in zip(datos_filas, huellas) if not cache_fragmentos.existe(huella)]
+
+        # Reducir las fotos a la resolución con la que se muestran; con dpi_fotos=None se insertan las originales.
+        # Solo hacen falta las de las incidencias que se van a generar.
+        fotos_optimizadas = None
+        if dpi_fotos:
+            rutas_fotos = [ruta for datos in pendientes for ruta in rutas_fotos_incidencia(datos, carpeta_imagenes)]
+            with medir(metricas, "fotos"):
+                fotos_optimizadas = preparar_fotos(rutas_fotos, carpeta_cache_fotos, dpi=dpi_fotos, calidad=calidad_fotos, control=control, ejecutor=recursos_informe.ejecutor_fotos)
+
+        # Se usan tantos hilos de renderizado como navegadores
+        opciones = dict(num_trabajadores=recursos_informe.num_navegadores, renderizador_mapas=recursos_informe.renderizador_mapas, fotos_optimizadas=fotos_optimizadas,
+                        indice_mapas_barrios=indice_mapas_barrios, cache_fragmentos=cache_fragmentos, control=control, metricas=metricas)
+        if carpeta_bloques:
+            # Informe por bloques (o por barrio) en carpeta_bloques, reanudable
+            crear_informes_por_bloques(datos_filas, carpeta_imagenes, carpeta_mapas_barrios, carpeta_bloques, tamano_bloque, por_barri, fusionar_bloques, ruta_salida,
+                                       contexto, **opciones)
+        elif procesos_documento > 1:
+            # Documento montado en varios procesos y unido al final (ver crear_tablas_informes_por_procesos)
+            crear_tablas_informes_por_procesos(datos_filas, carpeta_imagenes, carpeta_mapas_barrios, procesos_documento, ruta_salida=ruta_salida, **opciones)
+        else:
+            crear_tablas_informes(datos_filas, carpeta_imagenes, carpeta_mapas_barrios, ruta_salida=ruta_salida, **opciones)
+        if cache_fragmentos is not None:
+            # El resumen de la caché se hace aquí, una vez por informe, y no en cada bloque ni en cada proceso de montaje
+            ruta_manifiesto = ruta_salida if not carpeta_bloques or fusionar_bloques else os.path.join(carpeta_bloques, "bloques")
+            cache_fragmentos.guardar_manifiesto(ruta_manifiesto, datos_filas, huellas)
+            cache_fragmentos.expulsar()
+        if cache_mapas is not None:
+            aciertos, fallos = cache_mapas.aciertos - aciertos_previos, cache_mapas.fallos - fallos_previos
+            print(f"Caché de mapas: {aciertos} aciertos, {fallos} fallos")
+            if metricas is not None:
+                metricas.contar("mapas_cache_aciertos", aciertos)
+                metricas.contar("mapas_cache_fallos", fallos)
+        if metricas is not None and cache_fragmentos is not None:
+            metricas.contar("fragmentos_reutilizados", cache_fragmentos.reutilizados)
+            metricas.contar("fragmentos_generados", cache_fragmentos.generados)
     print("Fin de generar_informes")
 
+def generar_informes_lote(rutas_excel, carpeta_imagenes, ruta_excel_calles, carpeta_mapas_barrios, carpeta_salida, control=None,
+                          reutilizar_navegador=True, num_navegadores=1, ruta_teselas=None, carpeta_cache_mapas=CARPETA_CACHE_MAPAS,
+                          carpeta_cache_excel=CARPETA_CACHE_EXCEL, ruta_barrios_geojson=None, renderizador_mapas=None, version_mapas=None, **opciones):
+    # Genera un informe por cada Excel de rutas_excel (rutas o patrones como "auditorias/*.xlsx"), en
+    # orden, con un solo RecursosInforme para todos: las calles se leen una vez, los navegadores se
+    # arrancan una vez y las cachés de mapas, fotos y fragmentos se comparten. Cada informe se guarda
+    # en carpeta_salida con el nombre de su Excel (lote_3.xlsx -> lote_3.docx). Si un Excel falla se
+    # sigue con los demás. Las demás opciones se pasan a generar_informes (dpi_fotos, procesos_documento...).
+    # Devuelve una lista de (ruta_excel, ruta_salida, error), con error=None si el informe se generó.
+    if isinstance(rutas_excel, str):
+        rutas_excel = [rutas_excel]
+    trabajos = []
+    nombres_usados = set()
+    for patron in rutas_excel:
+        for ruta_excel in (sorted(glob.glob(patron)) if glob.has_magic(patron) else [patron]):
+            # Dos Excel con el mismo nombre en carpetas distintas no deben escribir el mismo informe
+            base = os.path.splitext(os.path.basename(ruta_excel))[0]
+            nombre, repeticion = base, 1
+            while nombre.lower() in nombres_usados:
+                repeticion += 1
+                nombre = f"{base}_{repeticion}"
+            nombres_usados.add(nombre.lower())
+            trabajos.append((ruta_excel, os.path.join(carpeta_salida, f"{nombre}.docx")))
+    if not trabajos:
+        print("No hay ningún Excel que procesar")
+        return []
+
+    os.makedirs(carpeta_salida, exist_ok=True)
+    resultados = []
+    with RecursosInforme(ruta_excel_calles, carpeta_mapas_barrios, reutilizar_navegador, num_navegadores, ruta_teselas,
+                         carpeta_cache_mapas, carpeta_cache_excel, ruta_barrios_geojson, renderizador_mapas=renderizador_mapas,
+                         version_mapas=version_mapas) as recursos_informe:
+        for numero, (ruta_excel, ruta_salida) in enumerate(trabajos, start=1):
+            print(f"Informe {numero}/{len(trabajos)}: {ruta_excel} -> {ruta_salida}")
+            avanzar(control, "Informes del lote", numero - 1, len(trabajos))
+            try:
+                generar_informes(ruta_excel, carpeta_imagenes, ruta_excel_calles, carpeta_mapas_barrios, ruta_salida=ruta_salida, control=control,
+                                 carpeta_cache_excel=carpeta_cache_excel, recursos_informe=recursos_informe, **opciones)
+            except TrabajoCancelado:
+                raise
+            except Exception as error:
+                traceback.print_exc()
+                resultados.append((ruta_excel, ruta_salida, error))
+            else:
+                resultados.append((ruta_excel, ruta_salida, None))
+
+    fallidos = [resultado for resultado in resultados if resultado[2] is not None]
+    print(f"Lote terminado: {len(resultados) - len(fallidos)} informes generados, {len(fallidos)} con errores")
+    for ruta_excel, _, error in fallidos:
+        print(f"  {ruta_excel}: {error}")
+    return resultados
+
+def precargar_dependencias():
+    # Importar pandas, folium, PIL y selenium en un hilo aparte mientras el usuario elige los
+    # archivos, para que al pulsar "Generar Informes" ya estén cargados
+    import pandas
+    import folium
+    import PIL.Image
+    import selenium.webdriver
+
+def ejecutar_en_segundo_plano(control, *args, **kwargs):
+    # Lanza generar_informes en un hilo aparte. Al terminar deja en control.mensajes
+    # ("fin", None, None), ("cancelado", None, None) o ("error", excepción, None).
+    def trabajo():
+        try:
+            generar_informes(*args, control=control, **kwargs)
+        except TrabajoCancelado:
+            control.mensajes.put(("cancelado", None, None))
+        except Exception as error:
+            traceback.print_exc()
+            control.mensajes.put(("error", error, None))
+        else:
+            control.mensajes.put(("fin", None, None))
+
+    hilo = threading.Thread(target=trabajo, name="generar_informes", daemon=True)
+    hilo.start()
+    return hilo
+
+def main_cli(argv=None):
+    # Punto de entrada sin interfaz gráfica, para ejecuciones programadas en un servidor
+    parser = argparse.ArgumentParser(description="Genera el informe de incidencias en Word a partir de la auditoría en Excel.")
+    parser.add_argument("--excel", help="archivo Excel principal de la auditoría")
+    parser.add_argument("--lote", nargs="+", metavar="EXCEL", help="varios Excel (o patrones como 'auditorias/*.xlsx'): un informe por Excel en --carpeta-salida")
+    parser.add_argument("--carpeta-salida", default="informes", help="carpeta de los informes del lote (por defecto %(default)s)")
+    parser.add_argument("--fotos", required=True, help="carpeta de fotos de las incidencias")
+    parser.add_argument("--calles", required=True, help="archivo Excel de calles y barrios")
+    parser.add_argument("--mapas-barrios", required=True, help="carpeta de mapas de barrios")
+    parser.add_argument("--salida", default=RUTA_INFORME, help="documento Word de salida (por defecto %(default)s)")
+    parser.add_argument("--navegadores", type=int, default=1, help="número de navegadores para renderizar mapas en paralelo")
+    parser.add_argument("--teselas", help="carpeta de teselas o archivo MBTiles para generar los mapas sin navegador")
+    parser.add_argument("--bloques", help="carpeta donde escribir el informe por bloques (reanudable)")
+    parser.add_argument("--tamano-bloque", type=int, default=100, help="incidencias por bloque (por defecto %(default)s)")
+    parser.add_argument("--por-barri", action="store_true", help="un bloque por barrio en lugar de bloques de tamaño fijo")
+    parser.add_argument("--fusionar", action="store_true", help="unir los bloques en el documento de salida al terminar")
+    parser.add_argument("--barrios-geojson", help="GeoJSON con los límites de los barrios, para asignarlos por coordenadas")
+    parser.add_argument("--dpi-fotos", type=int, default=150, help="resolución de las fotos en el documento; 0 para insertar las originales (por defecto %(default)s)")
+    parser.add_argument("--calidad-fotos", type=int, default=85, help="calidad JPEG de las fotos reducidas, de 1 a 95 (por defecto %(default)s)")
+    parser.add_argument("--procesos", type=int, default=1, help="procesos para montar el documento en paralelo (por defecto %(default)s)")
+    parser.add_argument("--metricas", help="archivo JSON donde guardar tiempos y memoria por etapa")
+    parser.add_argument("--perfil", help="archivo donde guardar el perfil de cProfile (para pstats o snakeviz)")
+    args = parser.parse_args(argv)
+    if bool(args.excel) == bool(args.lote):
+        parser.error("hay que indicar --excel o --lote (solo uno de los dos)")
+    if args.dpi_fotos < 0 or not 1 <= args.calidad_fotos <= 95:
+        parser.error("--dpi-fotos no puede ser negativo y --calidad-fotos debe estar entre 1 y 95")
+
+    def mostrar_avance(etapa, hecho, total):
+        print(f"[{etapa}] {hecho}/{total}" if total else f"[{etapa}]", flush=True)
+
+    try:
+        if args.lote:
+            resultados = generar_informes_lote(args.lote, args.fotos, args.calles, args.mapas_barrios, args.carpeta_salida,
+                                               control=ControlTrabajo(mostrar_avance), num_navegadores=args.navegadores, ruta_teselas=args.teselas,
+                                               ruta_barrios_geojson=args.barrios_geojson, procesos_documento=args.procesos,
+                                               dpi_fotos=args.dpi_fotos, calidad_fotos=args.calidad_fotos)
+            return 1 if any(error is not None for _, _, error in resultados) else 0
+        generar_informes(args.excel, args.fotos, args.calles, args.mapas_barrios,
+                         num_navegadores=args.navegadores, ruta_teselas=args.teselas,
+                         carpeta_bloques=args.bloques, tamano_bloque=args.tamano_bloque,
+                         por_barri=args.por_barri, fusionar_bloques=args.fusionar,
+                         ruta_salida=args.salida, control=ControlTrabajo(mostrar_avance),
+                         ruta_metricas=args.metricas, ruta_perfil=args.perfil, procesos_documento=args.procesos,
+                         ruta_barrios_geojson=args.barrios_geojson, dpi_fotos=args.dpi_fotos, calidad_fotos=args.calidad_fotos)
+    except KeyboardInterrupt:
+        print("Cancelado")
+        return 130
+    return 0
 
 def main():
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, ttk
+
     def browse_file():
         filename = filedialog.askopenfilename()
         entry_excel_path.delete(0, tk.END)
@@ -460,13 +2231,52 @@ def main():
         entry_barrios_map_path.delete(0, tk.END)
         entry_barrios_map_path.insert(0, foldername)
 
+    # Trabajo en curso; la generación se hace en otro hilo para no bloquear la ventana
+    trabajo = {"control": None}
+
     def execute_script():
         ruta_excel = entry_excel_path.get()
         carpeta_imagenes = entry_photos_path.get()
         ruta_excel_calles = entry_streets_excel_path.get()
         carpeta_mapas_barrios = entry_barrios_map_path.get()
         # Aquí llamas a tu función principal del script con las rutas y carpetas obtenidas
-        generar_informes(ruta_excel, carpeta_imagenes, ruta_excel_calles, carpeta_mapas_barrios)
+        trabajo["control"] = ControlTrabajo()
+        ejecutar_en_segundo_plano(trabajo["control"], ruta_excel, carpeta_imagenes, ruta_excel_calles, carpeta_mapas_barrios)
+        button_execute.config(state=tk.DISABLED)
+        button_cancel.config(state=tk.NORMAL)
+        label_progress.config(text="Iniciando...")
+        root.after(100, poll_progress)
+
+    def cancel_script():
+        if trabajo["control"] is not None:
+            trabajo["control"].cancelar()
+            label_progress.config(text="Cancelando...")
+
+    def poll_progress():
+        # Recoger los mensajes del hilo de trabajo y actualizar la ventana
+        control = trabajo["control"]
+        while True:
+            try:
+                etapa, hecho, total = control.mensajes.get_nowait()
+            except queue.Empty:
+                break
+            if etapa in ("fin", "cancelado", "error"):
+                trabajo["control"] = None
+                button_execute.config(state=tk.NORMAL)
+                button_cancel.config(state=tk.DISABLED)
+                progress_bar["value"] = 0
+                if etapa == "fin":
+                    label_progress.config(text="Informe generado")
+                    messagebox.showinfo("Generador de Informes", "Informe generado correctamente.")
+                elif etapa == "cancelado":
+                    label_progress.config(text="Cancelado")
+                else:
+                    label_progress.config(text="Error")
+                    messagebox.showerror("Generador de Informes", f"Error al generar el informe:\n{hecho}")
+                return
+            label_progress.config(text=f"{etapa} {hecho}/{total}" if total else etapa)
+            progress_bar["value"] = 100 * hecho / total if total else 0
+        root.after(100, poll_progress)
 
     root = tk.Tk()
     root.title("Generador de Informes")
@@ -496,11 +2306,27 @@ def main():
     tk.Button(root, text="Buscar", command=browse_barrios_map_folder).pack()
 
     # Botón para ejecutar el script
-    tk.Button(root, text="Generar Informes", command=execute_script).pack()
-
+    button_execute = tk.Button(root, text="Generar Informes", command=execute_script)
+    button_execute.pack()
+
+    # Progreso y cancelación del trabajo en curso
+    progress_bar = ttk.Progressbar(root, length=300, maximum=100)
+    progress_bar.pack()
+    label_progress = tk.Label(root, text="")
+    label_progress.pack()
+    button_cancel = tk.Button(root, text="Cancelar", command=cancel_script, state=tk.DISABLED)
+    button_cancel.pack()
+
+    # Cargar las dependencias pesadas cuando la ventana ya se ha dibujado
+    root.after_idle(lambda: threading.Thread(target=precargar_dependencias, daemon=True).start())
     root.mainloop()
 
 if __name__ == "__main__":
+    # Necesario para que el ProcessPoolExecutor funcione en el ejecutable de PyInstaller en Windows
+    multiprocessing.freeze_support()
+    # Con argumentos se ejecuta sin interfaz gráfica (ver main_cli); sin ellos se abre la ventana
+    if len(sys.argv) > 1:
+        sys.exit(main_cli())
     main()
 
 
@@ -15,12 +15,14 @@ a = Analysis(
 )
 pyz = PYZ(a.pure)
 
+# Se genera en modo carpeta (onedir) y no en un único .exe: el .exe de un solo archivo descomprime
+# todas las dependencias en un directorio temporal cada vez que se abre, y eso tardaba varios
+# segundos antes de que apareciera la ventana. Se distribuye la carpeta dist/report entera.
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.datas,
     [],
+    exclude_binaries=True,
     name='report',
     debug=False,
     bootloader_ignore_signals=False,
@@ -35,3 +37,12 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=True,
+    upx_exclude=[],
+    name='report',
+)
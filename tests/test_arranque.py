@@ -0,0 +1,12 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from bench_arranque import PESADAS, medir_importacion
+
+def test_import_report_no_carga_dependencias_pesadas():
+    # pandas, folium, PIL, selenium... solo se importan al generar el informe, no al abrir la ventana
+    milisegundos, cargadas = medir_importacion()
+    assert cargadas == [], f"import report carga {', '.join(cargadas)} (de {', '.join(PESADAS)})"
+    # Límite holgado para no depender de la máquina: el de bench_arranque.py es 300 ms
+    assert milisegundos < 1500
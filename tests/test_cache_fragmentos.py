@@ -0,0 +1,32 @@
+import os
+import sys
+
+from docx import Document
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report import CacheFragmentos, RegistroImagenes, agregar_imagen_en_celda
+
+def guardar_fragmento(cache, huella, ruta_imagen):
+    doc = Document()
+    tabla = doc.add_table(rows=1, cols=1)
+    agregar_imagen_en_celda(tabla.cell(0, 0), ruta_imagen, RegistroImagenes(doc))
+    cache.guardar(huella, doc, [tabla._tbl])
+
+def test_fragmento_sin_imagen_es_un_fallo(tmp_path):
+    # Si otra ejecución ha borrado una imagen del fragmento, se trata como si no estuviera en la caché
+    ruta_imagen = str(tmp_path / "mapa.jpg")
+    Image.new("RGB", (300, 200), (120, 180, 200)).save(ruta_imagen)
+    cache = CacheFragmentos(str(tmp_path / "fragmentos"))
+    guardar_fragmento(cache, "abc", ruta_imagen)
+
+    fragmento = cache.cargar("abc")
+    assert fragmento is not None
+    doc = Document()
+    cache.insertar(doc, fragmento, RegistroImagenes(doc))
+    assert len(doc.tables) == 1
+
+    for nombre in os.listdir(cache.carpeta_imagenes):
+        os.remove(os.path.join(cache.carpeta_imagenes, nombre))
+    assert cache.existe("abc")
+    assert cache.cargar("abc") is None
@@ -0,0 +1,44 @@
+import os
+import random
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report import IndiceCalles
+
+PREFIJOS = ["Carrer de", "Carrer del", "Avinguda de", "Passeig de", "Plaça de", "Rambla de", "Travessera de"]
+SILABAS = ["ma", "ri", "na", "pe", "re", "llu", "to", "sa", "gra", "cia", "ver", "dag", "ue", "bo"]
+
+def barri_bucle_original(lloc_thoroughfare, nombres_via, barris):
+    # El bucle de leer_datos_desde_excel antes del índice: primera calle contenida en la dirección
+    lloc_thoroughfare = lloc_thoroughfare.lower() if pd.notna(lloc_thoroughfare) else ''
+    for nombre, barri in zip(nombres_via, barris):
+        nom_via = nombre.lower() if pd.notna(nombre) else ''
+        if nom_via in lloc_thoroughfare:
+            return barri
+    return ''
+
+def test_calles_con_el_mismo_nombre_y_distinto_tipo():
+    nombres = ["Plaça de Catalunya", "Rambla de Catalunya", "Passeig de Gràcia", "Travessera de Gràcia", "Mar", "Marina"]
+    barris = ["Dreta de l'Eixample", "Antiga Esquerra", "Dreta de l'Eixample", "Vila de Gràcia", "Barceloneta", "Parc"]
+    indice = IndiceCalles(nombres, barris)
+    direcciones = ["Rambla de Catalunya", "Travessera de Gràcia", "Passeig de Gràcia", "Carrer de la Marina", "Passeig del Mar", "Carrer de Pujades"]
+    for direccion in direcciones:
+        assert indice.buscar_barri(direccion) == barri_bucle_original(direccion, nombres, barris), direccion
+
+def test_abreviaturas_de_tipo_de_via():
+    indice = IndiceCalles(["Avinguda Diagonal", "Passeig de Gràcia"], ["Diagonal Mar", "Dreta de l'Eixample"])
+    assert indice.buscar_barri("Av. Diagonal") == "Diagonal Mar"
+    assert indice.buscar_barri("Pg. de Gràcia") == "Dreta de l'Eixample"
+
+def test_igual_que_el_bucle_original_en_un_registro_de_muestra():
+    rng = random.Random(0)
+    nombres = ["".join(rng.choice(SILABAS) for _ in range(rng.randint(1, 3))).capitalize() for _ in range(300)]
+    nombres = [f"{rng.choice(PREFIJOS)} {nombre}" if rng.random() < 0.3 else nombre for nombre in nombres] + [None]
+    barris = [f"Barri {i % 40}" for i in range(len(nombres))]
+    direcciones = [f"{rng.choice(PREFIJOS)} {rng.choice(nombres[:-1]).split(' ')[-1]}" for _ in range(2000)] + [None, ""]
+
+    indice = IndiceCalles(nombres, barris)
+    esperados = [barri_bucle_original(direccion, nombres, barris) for direccion in direcciones]
+    assert indice.asignar_barris(pd.Series(direcciones, dtype=object)).tolist() == esperados
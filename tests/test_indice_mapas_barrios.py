@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report import IndiceMapasBarrios
+
+def crear_mapas(carpeta, nombres):
+    for nombre in nombres:
+        (carpeta / nombre).write_bytes(b"")
+
+def test_encuentra_lo_que_encontraba_la_busqueda_original(tmp_path):
+    # La búsqueda original era "barri in archivo": el barrio puede ir pegado a otras letras o números
+    crear_mapas(tmp_path, ["BarriGracia.jpg", "mapa-SantAndreu.jpg", "Sants2023.jpg"])
+    indice = IndiceMapasBarrios(str(tmp_path))
+    assert indice.buscar("Gracia") == str(tmp_path / "BarriGracia.jpg")
+    assert indice.buscar("SantAndreu") == str(tmp_path / "mapa-SantAndreu.jpg")
+    assert indice.buscar("Sants") == str(tmp_path / "Sants2023.jpg")
+    assert indice.buscar("Poblenou") is None
+
+def test_desempate_determinista(tmp_path):
+    crear_mapas(tmp_path, ["Vila de Gràcia.jpg", "Gracia.jpg", "Graciapolis.jpg", "mapa_Sants-Montjuic.jpg", "Sants.jpg", "b_Sant.jpg", "a_Sant.jpg"])
+    indice = IndiceMapasBarrios(str(tmp_path))
+    # Palabras completas antes que subcadenas, después el nombre más corto y después el orden alfabético
+    assert indice.buscar("Gràcia") == str(tmp_path / "Gracia.jpg")
+    assert indice.buscar("Vila de Gracia") == str(tmp_path / "Vila de Gràcia.jpg")
+    assert indice.buscar("Sants") == str(tmp_path / "Sants.jpg")
+    assert indice.buscar("Sant") == str(tmp_path / "a_Sant.jpg")
+    assert indice.buscar("Graciap") == str(tmp_path / "Graciapolis.jpg")
@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import report
+
+MB = 1024 * 1024
+
+@pytest.fixture(params=["nucleo", "muestreo"])
+def pico_memoria(request, monkeypatch):
+    pico = report.PicoMemoria()
+    if request.param == "muestreo":
+        pico._usar_nucleo = False
+    elif not sys.platform.startswith("linux"):
+        pytest.skip("el pico del núcleo solo se usa en Linux")
+    monkeypatch.setattr(report, "PICO_MEMORIA", pico)
+    if report.memoria_actual_mb() is None:
+        pytest.skip("no se puede leer la memoria del proceso en esta plataforma")
+    return pico
+
+def test_pico_por_etapa_con_memoria_liberada_antes_de_terminar(pico_memoria):
+    metricas = report.Metricas()
+    with metricas.etapa("exterior"):
+        with metricas.etapa("interior"):
+            # 150 MB escritos (para que sean residentes) y liberados antes de cerrar la etapa
+            bloque = bytearray(b"\x01") * (150 * MB)
+            time.sleep(0.1)
+            del bloque
+        with metricas.etapa("despues"):
+            pass
+    intervalo = metricas.abrir_memoria()
+    metricas.incidencia(1, 0.0, "generada", metricas.cerrar_memoria(intervalo))
+
+    resumen = metricas.resumen()
+    etapas = resumen["etapas"]
+    assert etapas["interior"]["rss_incremento_mb"] > 120
+    assert etapas["exterior"]["rss_pico_mb"] >= etapas["interior"]["rss_pico_mb"]
+    assert etapas["despues"]["rss_incremento_mb"] < 50
+    assert etapas["despues"]["rss_pico_mb"] < etapas["interior"]["rss_pico_mb"] - 100
+    assert resumen["incidencias"][0]["rss_pico_mb"] is not None
+    assert resumen["rss_pico_mb"] >= etapas["interior"]["rss_pico_mb"]
@@ -0,0 +1,68 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+from selenium.common.exceptions import WebDriverException
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report import PoolNavegadores
+
+class DriverSimulado:
+    def __init__(self, falla=False):
+        self.falla = falla
+        self.cerrado = False
+
+    def get(self, url):
+        if self.falla:
+            # Tarda un poco en fallar, para que los demás hilos ya estén esperando sesión
+            time.sleep(0.05)
+            raise WebDriverException("sesión caída")
+
+    def set_window_size(self, ancho, alto):
+        pass
+
+    def save_screenshot(self, ruta):
+        return True
+
+    def quit(self):
+        self.cerrado = True
+
+def capturar_en_hilos(pool, num_hilos):
+    errores = []
+    def capturar():
+        try:
+            pool.capturar("mapa.html", "mapa.png")
+        except WebDriverException as error:
+            errores.append(error)
+    hilos = [threading.Thread(target=capturar, daemon=True) for _ in range(num_hilos)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(timeout=10)
+    return hilos, errores
+
+@pytest.mark.parametrize("fabrica_falla", [False, True])
+def test_los_hilos_en_espera_no_se_quedan_bloqueados(fabrica_falla):
+    # Con una sola sesión que siempre falla (o que no se puede ni crear), todos los hilos terminan con el error
+    def fabrica():
+        if fabrica_falla:
+            time.sleep(0.05)
+            raise WebDriverException("no arranca")
+        return DriverSimulado(falla=True)
+    pool = PoolNavegadores(1, fabrica)
+    hilos, errores = capturar_en_hilos(pool, 3)
+    assert not any(hilo.is_alive() for hilo in hilos)
+    assert len(errores) == 3
+
+def test_reutiliza_las_sesiones():
+    creados = []
+    def fabrica():
+        creados.append(DriverSimulado())
+        return creados[-1]
+    with PoolNavegadores(2, fabrica) as pool:
+        hilos, errores = capturar_en_hilos(pool, 6)
+        assert not errores and not any(hilo.is_alive() for hilo in hilos)
+        assert 1 <= len(creados) <= 2
+    assert all(driver.cerrado for driver in creados)
@@ -0,0 +1,36 @@
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report import preparar_fotos
+
+def crear_fotos(carpeta, nombres):
+    rutas = []
+    for numero, nombre in enumerate(nombres):
+        ruta = str(carpeta / f"{nombre}.jpg")
+        Image.effect_noise((1500, 1000), 40 + numero).convert("RGB").save(ruta)
+        rutas.append(ruta)
+    return rutas
+
+def test_la_cache_de_fotos_no_pasa_del_tamano_maximo(tmp_path):
+    cache = tmp_path / "cache"
+    antiguas = crear_fotos(tmp_path, ["a", "b", "c"])
+    nuevas = crear_fotos(tmp_path, ["d", "e", "f"])
+    with ThreadPoolExecutor(2) as ejecutor:
+        reducidas_antiguas = preparar_fotos(antiguas, str(cache), ejecutor=ejecutor)
+        assert len(os.listdir(cache)) == 3
+        time.sleep(0.05)
+
+        # Cabe poco más que un informe: las fotos del informe anterior son las que se borran
+        tamano_informe = sum(os.path.getsize(ruta) for ruta in reducidas_antiguas.values())
+        reducidas = preparar_fotos(nuevas, str(cache), ejecutor=ejecutor, tamano_maximo=tamano_informe * 1.5)
+        assert all(os.path.exists(ruta) for ruta in reducidas.values())
+        assert sum(os.path.exists(ruta) for ruta in reducidas_antiguas.values()) <= 1
+
+        # Las fotos del informe en curso no se borran aunque no quepan
+        reducidas = preparar_fotos(nuevas, str(cache), ejecutor=ejecutor, tamano_maximo=1)
+        assert all(os.path.exists(ruta) for ruta in reducidas.values())
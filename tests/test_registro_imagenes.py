@@ -0,0 +1,37 @@
+import os
+import shutil
+import sys
+import zipfile
+
+from docx import Document
+from docx.oxml.ns import qn
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report import RegistroImagenes, agregar_imagen_en_celda
+
+def test_una_parte_por_imagen_distinta(tmp_path):
+    # El mismo mapa de barrio en muchas incidencias (y copiado con otro nombre) se guarda una sola vez
+    ruta_mapa = str(tmp_path / "mapa_Gràcia.jpg")
+    Image.new("RGB", (1200, 900), (120, 180, 200)).save(ruta_mapa)
+    ruta_copia = str(tmp_path / "mapa_Vila de Gràcia.jpg")
+    shutil.copyfile(ruta_mapa, ruta_copia)
+
+    doc = Document()
+    registro_imagenes = RegistroImagenes(doc)
+    veces = 25
+    tabla = doc.add_table(rows=veces + 1, cols=1)
+    for fila in range(veces):
+        agregar_imagen_en_celda(tabla.cell(fila, 0), ruta_mapa, registro_imagenes)
+    agregar_imagen_en_celda(tabla.cell(veces, 0), ruta_copia, registro_imagenes)
+    assert registro_imagenes.num_partes == 1
+
+    ruta_docx = str(tmp_path / "informe.docx")
+    doc.save(ruta_docx)
+    with zipfile.ZipFile(ruta_docx) as docx:
+        assert len([nombre for nombre in docx.namelist() if nombre.startswith("word/media/")]) == 1
+
+    cuerpo = Document(ruta_docx).element.body
+    assert len(list(cuerpo.iter(qn("a:blip")))) == veces + 1
+    ids = [doc_pr.get("id") for doc_pr in cuerpo.iter(qn("wp:docPr"))]
+    assert len(set(ids)) == len(ids)